@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""
+Structural order metrics of a particle snapshot.
+
+Everything here works on plain arrays (positions, group index of each
+particle, radii), so it can be used on a live Simulation as well as on the
+frames of a recorded Trajectory. Neighbours are found with a cell list
+built in NumPy, which takes a few tens of milliseconds for 20k particles.
+
+    bondOrder       per-particle and global psi_n (psi4, psi6, ...)
+    coordination    number of touching neighbours of each particle
+    radialDistribution  g(r), overall and for every pair of groups
+    structure       summary numbers of a snapshot, from one neighbour pass
+
+Two particles count as neighbours when their centers are closer than shell
+times the sum of their radii. The default shell of 1.2 takes in the first
+shell of a hexagonal packing and stops well short of the second.
+
+"""
+
+import numpy as np
+
+# (dx, dy) of the cells to pair each cell with, so every pair is found once
+HALF_STENCIL = ((0, 0), (1, -1), (1, 0), (1, 1), (0, 1))
+
+
+def neighbourPairs(pos, cutoff):
+    """Every pair of positions closer than cutoff
+
+    Returns index arrays i and j with i != j, each pair listed once, and the
+    (M, 2) separation vectors pos[j] - pos[i].
+    """
+    pos = np.asarray(pos, dtype=float)
+    n = len(pos)
+    if n < 2 or cutoff <= 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros((0, 2))
+
+    cell = np.floor((pos - pos.min(axis=0))/cutoff).astype(np.int64)
+    nx, ny = cell.max(axis=0) + 1
+    key = cell[:, 0]*ny + cell[:, 1]
+    order = np.argsort(key, kind="stable")
+    counts = np.bincount(key, minlength=nx*ny)
+    starts = np.cumsum(counts) - counts
+
+    allI, allJ, allD = [], [], []
+    for dx, dy in HALF_STENCIL:
+        cx = cell[:, 0] + dx
+        cy = cell[:, 1] + dy
+        src = np.flatnonzero((cx >= 0) & (cx < nx) & (cy >= 0) & (cy < ny))
+        other = cx[src]*ny + cy[src]
+        c = counts[other]
+
+        # every particle of the source cell against every one in the other cell
+        i = np.repeat(src, c)
+        k = np.arange(len(i)) - np.repeat(np.cumsum(c) - c, c)
+        j = order[np.repeat(starts[other], c) + k]
+        if (dx, dy) == (0, 0):
+            keep = i < j
+            i, j = i[keep], j[keep]
+
+        d = pos[j] - pos[i]
+        close = d[:, 0]**2 + d[:, 1]**2 < cutoff**2
+        allI.append(i[close])
+        allJ.append(j[close])
+        allD.append(d[close])
+
+    return np.concatenate(allI), np.concatenate(allJ), np.concatenate(allD)
+
+
+def touching(pos, radii, shell=1.2):
+    """neighbourPairs restricted to particles closer than shell*(ri + rj)"""
+    radii = np.asarray(radii, dtype=float)
+    if len(radii) == 0:
+        return neighbourPairs(pos, 0)
+    i, j, d = neighbourPairs(pos, shell*2*radii.max())
+    close = np.hypot(d[:, 0], d[:, 1]) < shell*(radii[i] + radii[j])
+    return i[close], j[close], d[close]
+
+
+def bondOrderFromPairs(n, i, j, d, order=6):
+    """Per-particle psi_n from neighbour pairs, see bondOrder"""
+    theta = np.arctan2(d[:, 1], d[:, 0])
+    z = np.exp(1j*order*theta)
+    # seen from j the bond points the other way, a turn of pi
+    zBack = z*(-1)**order
+    total = (np.bincount(i, z.real, n) + np.bincount(j, zBack.real, n)
+             + 1j*(np.bincount(i, z.imag, n) + np.bincount(j, zBack.imag, n)))
+    count = np.bincount(i, minlength=n) + np.bincount(j, minlength=n)
+    psi = np.zeros(n, dtype=complex)
+    np.divide(total, count, out=psi, where=count > 0)
+    return psi, count
+
+
+def bondOrder(pos, radii, order=6, shell=1.2):
+    """Bond-orientational order psi_n of every particle and of the whole snapshot
+
+    psi_n of a particle is the mean of exp(i*n*theta) over the directions
+    theta to its neighbours: magnitude 1 for a perfect n-fold environment.
+    The global value is the magnitude of the mean over every particle with
+    neighbours, which is also 1 only if they all share one orientation.
+    Returns (per-particle complex psi, global psi).
+    """
+    n = len(pos)
+    i, j, d = touching(pos, radii, shell)
+    psi, count = bondOrderFromPairs(n, i, j, d, order)
+    has = count > 0
+    return psi, float(abs(psi[has].mean())) if has.any() else 0.0
+
+
+def coordination(pos, radii, shell=1.2):
+    """Number of touching neighbours of every particle"""
+    i, j, _ = touching(pos, radii, shell)
+    return np.bincount(i, minlength=len(pos)) + np.bincount(j, minlength=len(pos))
+
+
+def radialDistribution(pos, groupIndex=None, box=None, rmax=5.0, bins=100):
+    """Radial distribution function g(r) up to rmax
+
+    The world has walls rather than periodic edges, so only particles at
+    least rmax away from every side of box serve as centers, which keeps
+    the walls from pulling g(r) down at large r. box is
+    ((xmin, xmax), (ymin, ymax)) and defaults to the extent of the
+    particles. Returns the bin centers, the overall g(r), and a dict of
+    (group a, group b) -> partial g(r) of b particles around a particles.
+    """
+    pos = np.asarray(pos, dtype=float)
+    n = len(pos)
+    groupIndex = np.zeros(n, dtype=np.int64) if groupIndex is None else np.asarray(groupIndex)
+    if box is None:
+        box = ((pos[:, 0].min(), pos[:, 0].max()), (pos[:, 1].min(), pos[:, 1].max())) if n else ((0, 1), (0, 1))
+    area = (box[0][1] - box[0][0])*(box[1][1] - box[1][0])
+
+    edges = np.linspace(0, rmax, bins + 1)
+    r = (edges[1:] + edges[:-1])/2
+    shellArea = np.pi*(edges[1:]**2 - edges[:-1]**2)
+
+    center = ((pos[:, 0] - box[0][0] >= rmax) & (box[0][1] - pos[:, 0] >= rmax)
+              & (pos[:, 1] - box[1][0] >= rmax) & (box[1][1] - pos[:, 1] >= rmax))
+
+    i, j, d = neighbourPairs(pos, rmax)
+    dist = np.hypot(d[:, 0], d[:, 1])
+    # every pair counts once from each end that is a center
+    src = np.concatenate((i[center[i]], j[center[j]]))
+    dst = np.concatenate((j[center[i]], i[center[j]]))
+    dist = np.concatenate((dist[center[i]], dist[center[j]]))
+    binOf = np.minimum((dist/rmax*bins).astype(np.int64), bins - 1)
+
+    def normalized(counts, centers, others):
+        if centers == 0 or others == 0:
+            return np.zeros(bins)
+        return counts/(centers*others/area*shellArea)
+
+    g = normalized(np.bincount(binOf, minlength=bins), center.sum(), n - 1)
+
+    # counts of every group pair from a single bincount
+    groups, local = np.unique(groupIndex, return_inverse=True)
+    m = len(groups)
+    pairCounts = np.bincount((local[src]*m + local[dst])*bins + binOf, minlength=m*m*bins).reshape(m, m, bins)
+    sizes = np.bincount(local, minlength=m)
+    centers = np.bincount(local[center], minlength=m)
+    partial = {}
+    for a in range(m):
+        for b in range(m):
+            others = sizes[b] - (1 if a == b else 0)
+            partial[(groups[a].item(), groups[b].item())] = normalized(pairCounts[a, b], centers[a], others)
+
+    return r, g, partial
+
+
+def structure(pos, radii, groupIndex=None, shell=1.2):
+    """Summary order metrics of one snapshot
+
+    Returns a dict with the global psi4 and psi6, the mean local |psi6| of
+    particles with at least two neighbours (one neighbour always gives 1),
+    the mean coordination number overall and for each group, and the
+    fraction of particles with six neighbours.
+    """
+    pos = np.asarray(pos, dtype=float)
+    n = len(pos)
+    groupIndex = np.zeros(n, dtype=np.int64) if groupIndex is None else np.asarray(groupIndex)
+    i, j, d = touching(pos, radii, shell)
+    psi4, count = bondOrderFromPairs(n, i, j, d, 4)
+    psi6, _ = bondOrderFromPairs(n, i, j, d, 6)
+    has = count > 0
+
+    result = {
+        "psi4": float(abs(psi4[has].mean())) if has.any() else 0.0,
+        "psi6": float(abs(psi6[has].mean())) if has.any() else 0.0,
+        "localPsi6": float(abs(psi6[count > 1]).mean()) if (count > 1).any() else 0.0,
+        "coordination": float(count.mean()) if n else 0.0,
+        "sixfold": float((count == 6).mean()) if n else 0.0,
+    }
+    for g in np.unique(groupIndex).tolist():
+        result["coordination_{}".format(g)] = float(count[groupIndex == g].mean())
+    return result
+
+
+def simulationStructure(sim, shell=1.2):
+    """structure() of the current state of a Simulation"""
+    return structure(sim.positions(), sim.radii, sim.groupIndex, shell)
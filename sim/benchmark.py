@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark suite of fixed, seeded assembly scenarios.
+
+Every scenario runs headless in a fresh process, one after another so they
+don't compete for the CPU, and reports its steps per second, the time per
+step of each phase (see profiler.py), its peak memory and its bond churn.
+The results go to a JSON file together with the commit they were measured
+on, and a second results file can be given to compare against:
+
+    python benchmark.py --out new.json --compare old.json
+
+Runs are seeded, so on the same machine and library versions the final
+bond counts should match exactly between two commits that don't change the
+physics. The comparison flags the scenarios where they don't.
+
+"""
+
+import json, multiprocessing, os, platform, subprocess, sys, time
+
+import numpy as np
+
+try:
+    import resource
+except ImportError: # not available on Windows
+    resource = None
+
+from simulation import (Simulation, parseGroup, TARGET_FPS)
+from profiler import PhaseProfiler
+
+SEED = 12345
+
+# name -> world size, groups, simulated seconds and parameters
+SCENARIOS = {
+    "single400": {
+        "size": (64, 36),
+        "groups": ["0.5:1:0:400"],
+        "seconds": 30,
+    },
+    "binary500": {
+        "size": (64, 36),
+        "groups": ["0.4:1:1:500", "0.25:1:0:500"],
+        "seconds": 30,
+    },
+    "mixed400": {
+        "size": (64, 36),
+        "groups": ["0.5:1:0,1:400", "0.5:1:0:400"],
+        "seconds": 30,
+    },
+    "stress4x5000": {
+        "size": (160, 90),
+        "groups": ["0.3:1:1:5000", "0.3:1:0,2:5000", "0.25:1:1,3:5000", "0.25:1:2:5000"],
+        "seconds": 5,
+        "seeding": "lattice",
+    },
+}
+
+
+def peakMemoryMB():
+    """Peak resident memory of this process, or None where it can't be read"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak/1024/1024 if sys.platform == "darwin" else peak/1024
+
+def commitID():
+    # ask the repository this file is in, wherever the benchmark is run from
+    repo = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=repo, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=repo, capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ("-dirty" if dirty else "")
+
+def environment():
+    import Box2D
+    return {
+        "commit": commitID(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "box2d": getattr(Box2D, "__version__", None),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "platform": platform.platform(),
+    }
+
+
+def runScenario(job):
+    """Run one scenario in this process and return its measurements"""
+    name, scale = job
+    scenario = SCENARIOS[name]
+    start = time.perf_counter()
+    sim = Simulation(*scenario["size"], seed=SEED)
+    sim.setDissociationRate(scenario.get("dissocRate", 15))
+    sim.setCooldown(scenario.get("cooldown", 0.2))
+    sim.setStiffness(scenario.get("stiffness", 10))
+    sim.setTemp(scenario.get("temp", 20))
+    sim.reset([parseGroup(g, i) for i, g in enumerate(scenario["groups"])], seeding=scenario.get("seeding", "rsa"))
+    setup = time.perf_counter() - start
+
+    sim.profiler = PhaseProfiler(window=None, enabled=True)
+    totalSteps = max(1, int(round(scenario["seconds"]*scale*TARGET_FPS)))
+    start = time.perf_counter()
+    while sim.steps < totalSteps:
+        n = min(TARGET_FPS, totalSteps - sim.steps)
+        sim.step(n)
+        sim.profiler.endSample(n)
+    wall = time.perf_counter() - start
+
+    stats = sim.profiler.stats()
+    counters = stats["counters"]
+    seconds = sim.time()
+    return name, {
+        "particles": len(sim.particles),
+        "steps": sim.steps,
+        "setupSeconds": setup,
+        "wallSeconds": wall,
+        "stepsPerSecond": sim.steps/wall,
+        "msPerStep": {k: p["msPerStep"] for k, p in stats["phases"].items()},
+        "peakMemoryMB": peakMemoryMB(),
+        "finalBonds": len(sim.bonds),
+        "bondsMadePerSecond": counters.get("bondsMade", {}).get("total", 0)/seconds,
+        "bondsBrokenPerSecond": counters.get("bondsBroken", {}).get("total", 0)/seconds,
+        "contactsPerStep": counters.get("contactsQueued", {}).get("perStep", 0.0),
+        "clusters": sim.clusters.count(),
+        "largestClusterFraction": sim.clusters.largestFraction(),
+    }
+
+
+def runBenchmarks(names, scale=1.0, repeat=1):
+    """Run the named scenarios and return the results, keeping the fastest of repeat runs"""
+    results = {"environment": environment(), "seed": SEED, "scale": scale, "scenarios": {}}
+    for name in names:
+        best = None
+        for _ in range(repeat):
+            # a fresh process per run, so peak memory belongs to this scenario alone
+            with multiprocessing.Pool(1, maxtasksperchild=1) as pool:
+                _, result = pool.apply(runScenario, ((name, scale),))
+            if best is None or result["stepsPerSecond"] > best["stepsPerSecond"]:
+                best = result
+        results["scenarios"][name] = best
+        print(formatResult(name, best))
+    return results
+
+def formatResult(name, r):
+    memory = "{:.0f} MB".format(r["peakMemoryMB"]) if r["peakMemoryMB"] is not None else "n/a"
+    phases = ", ".join("{0} {1:.2f}".format(k, v) for k, v in r["msPerStep"].items())
+    return ("{0}: {1} particles, {2:.0f} steps/s, peak {3}, {4} bonds, {5:.1f} made/s, {6:.1f} broken/s\n"
+            "    ms/step: {7}").format(name, r["particles"], r["stepsPerSecond"], memory, r["finalBonds"],
+                                       r["bondsMadePerSecond"], r["bondsBrokenPerSecond"], phases)
+
+def compareResults(old, new):
+    """Print the change of every scenario found in both result sets"""
+    print("Compared with {} ({}):".format(old["environment"].get("commit"), old["environment"].get("platform")))
+    if old.get("scale") != new.get("scale"):
+        print("    warning: the runs were {0} and {1} times the scenario length".format(old.get("scale"), new.get("scale")))
+    for name, n in new["scenarios"].items():
+        o = old["scenarios"].get(name)
+        if o is None:
+            continue
+        notes = []
+        if o["finalBonds"] != n["finalBonds"]:
+            notes.append("final bonds {0} -> {1}, the physics changed".format(o["finalBonds"], n["finalBonds"]))
+        if o["peakMemoryMB"] and n["peakMemoryMB"]:
+            notes.append("peak memory {0:+.0%}".format(n["peakMemoryMB"]/o["peakMemoryMB"] - 1))
+        print("{0}: {1:.0f} -> {2:.0f} steps/s ({3:+.1%}){4}".format(
+            name, o["stepsPerSecond"], n["stepsPerSecond"], n["stepsPerSecond"]/o["stepsPerSecond"] - 1,
+            "".join(", " + note for note in notes)))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run the benchmark scenarios")
+    parser.add_argument("scenario", nargs="*", help="scenarios to run (default: all of {})".format(", ".join(SCENARIOS)))
+    parser.add_argument("--out", default="benchmark.json", help="results file")
+    parser.add_argument("--compare", default=None, help="earlier results file to compare with")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per scenario, the fastest is kept")
+    parser.add_argument("--quick", action="store_true", help="run each scenario for a fifth of its length")
+    args = parser.parse_args()
+
+    names = args.scenario or list(SCENARIOS)
+    unknown = [n for n in names if n not in SCENARIOS]
+    if unknown:
+        parser.error("unknown scenarios: {}".format(", ".join(unknown)))
+
+    results = runBenchmarks(names, 0.2 if args.quick else 1.0, max(1, args.repeat))
+    with open(args.out, "w") as f:
+        json.dump(results, f, indent=2)
+    print("Results saved to {}".format(args.out))
+
+    if args.compare:
+        with open(args.compare) as f:
+            compareResults(json.load(f), results)
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+Column-wise storage for the bonds of a simulation.
+
+Every bond gets an integer ID which stays the same for its whole life. The
+ID indexes the state arrays directly, so per-bond state can be read and
+written for many bonds at once with NumPy. Freed IDs go on a free list and
+are handed out again, which makes both adding and removing a bond O(1).
+
+"""
+
+import numpy as np
+
+
+class BondRegistry():
+    def __init__(self, capacity=1024):
+        self.capacity = 0
+        self.pA = np.zeros(0, dtype=np.int32) # particle indices of the members
+        self.pB = np.zeros(0, dtype=np.int32)
+        self.point = np.zeros((0, 2)) # contact point the bond formed at
+        self.alive = np.zeros(0, dtype=bool) # slot holds a bond
+        self.newbond = np.zeros(0, dtype=bool) # bond is waiting for its joint
+        self.broken = np.zeros(0, dtype=bool) # joint is gone, bond is cooling down
+        self.cooldown = np.zeros(0, dtype=np.int32) # timesteps left before the pair may bond again
+        self.force = np.zeros(0) # last measured reaction force on the joint
+        self.contactAnchor = np.zeros(0, dtype=bool) # the joint is anchored at the contact point, not the centers
+        self.collide = np.zeros(0, dtype=bool) # the joint lets its particles collide
+        self.joints = []
+        self.free = []
+        self.pairs = {} # (lower particle index, higher particle index) -> bond ID
+
+        self.grow(capacity)
+
+    def __len__(self):
+        return len(self.pairs)
+
+    def grow(self, capacity):
+        """Make room for at least capacity bonds"""
+        old = self.capacity
+        if capacity <= old:
+            return
+
+        def extend(arr, fill):
+            new = np.full((capacity,) + arr.shape[1:], fill, dtype=arr.dtype)
+            new[:old] = arr
+            return new
+
+        self.pA = extend(self.pA, -1)
+        self.pB = extend(self.pB, -1)
+        self.point = extend(self.point, 0)
+        self.alive = extend(self.alive, False)
+        self.newbond = extend(self.newbond, False)
+        self.broken = extend(self.broken, False)
+        self.cooldown = extend(self.cooldown, 0)
+        self.force = extend(self.force, 0)
+        self.contactAnchor = extend(self.contactAnchor, False)
+        self.collide = extend(self.collide, False)
+        self.joints.extend([None]*(capacity - old))
+        # hand out the low IDs first
+        self.free.extend(range(capacity-1, old-1, -1))
+        self.capacity = capacity
+
+    def add(self, a, b, point=(0, 0)):
+        """Register a new bond between particles a and b and return its ID"""
+        if not self.free:
+            self.grow(2*self.capacity)
+        bondID = self.free.pop()
+
+        self.pA[bondID] = a
+        self.pB[bondID] = b
+        self.point[bondID] = point
+        self.alive[bondID] = True
+        self.newbond[bondID] = True
+        self.broken[bondID] = False
+        self.cooldown[bondID] = 0
+        self.force[bondID] = 0
+        self.pairs[(a, b) if a < b else (b, a)] = bondID
+
+        return bondID
+
+    def remove(self, bondID):
+        """Forget a bond. Its joint must already be destroyed."""
+        a = int(self.pA[bondID])
+        b = int(self.pB[bondID])
+        del self.pairs[(a, b) if a < b else (b, a)]
+
+        self.alive[bondID] = False
+        self.newbond[bondID] = False
+        self.broken[bondID] = False
+        self.joints[bondID] = None
+        self.free.append(int(bondID))
+
+    def find(self, a, b):
+        """ID of the bond between particles a and b, or None"""
+        return self.pairs.get((a, b) if a < b else (b, a))
+
+    def contains(self, a, b):
+        """Bulk find: whether each pair (a[k], b[k]) already has a bond"""
+        # one dict lookup per pair, so the cost follows the pairs asked about, not the bonds
+        pairs = self.pairs
+        lo = np.minimum(a, b).tolist()
+        hi = np.maximum(a, b).tolist()
+        return np.array([(x, y) in pairs for x, y in zip(lo, hi)], dtype=bool)
+
+    def ids(self, mask=None):
+        """IDs of every live bond, or of the live bonds selected by mask"""
+        if mask is None:
+            return np.flatnonzero(self.alive)
+        return np.flatnonzero(self.alive & mask)
+
+    def members(self, bondID):
+        return int(self.pA[bondID]), int(self.pB[bondID])
+
+    def rebuildIndex(self):
+        """Rebuild the pair lookup and free list after the columns were filled directly"""
+        ids = np.flatnonzero(self.alive)
+        self.pairs = {(min(a, b), max(a, b)): i
+                      for i, a, b in zip(ids.tolist(), self.pA[ids].tolist(), self.pB[ids].tolist())}
+        self.free = np.flatnonzero(~self.alive)[::-1].tolist()
+
+    def clear(self):
+        """Forget every bond. Their joints must already be destroyed."""
+        self.alive[:] = False
+        self.newbond[:] = False
+        self.broken[:] = False
+        self.joints = [None]*self.capacity
+        self.free = list(range(self.capacity-1, -1, -1))
+        self.pairs.clear()
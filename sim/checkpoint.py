@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+"""
+Checkpoint and restore of a whole simulation.
+
+A checkpoint is a NumPy .npz archive with one column per particle or bond
+property, plus a small JSON header for the scalar parameters, the groups
+and the random number generator. Restoring rebuilds the Box2D world with
+every body, joint and cooldown exactly as it was saved. Joints are recreated
+from their saved definition (local anchors, rest length, stiffness), not
+from the current particle positions. Box2D's contact cache is not saved,
+so Box2D reports every pair that was already touching as a new contact on
+the first step after a restore. The touching pairs are saved instead, and
+those reports are ignored rather than bonded. Solver warm starting is not
+saved either, so a restored run still drifts slightly away from an
+uninterrupted one.
+
+"""
+
+import io, json, os
+
+import numpy as np
+
+from field import Field
+from simulation import (Simulation, Particle, groupToDict, groupFromDict)
+
+CHECKPOINT_VERSION = 1
+
+
+def saveCheckpoint(sim, path, extra=None, compress=False):
+    """Write the state of sim to path
+
+    extra is any JSON serializable data to keep with the checkpoint, such as
+    the values of the menu. The file is written to a temporary name first,
+    so a crash while saving never destroys the previous checkpoint.
+    """
+    bonds = sim.bonds
+    ids = bonds.ids()
+
+    header = {
+        "version": CHECKPOINT_VERSION,
+        "width": sim.width,
+        "height": sim.height,
+        "steps": sim.steps,
+        "seed": sim.seed,
+        "gravity": list(sim.world.gravity),
+        "params": {
+            "dissociationRate": sim.dissociationRate,
+            "dissociationChance": sim.dissociationChance,
+            "jointCooldown": sim.jointCooldown,
+            "temp": sim.temp,
+            "stiffness": sim.stiffness,
+            "anchorContact": sim.anchorContact,
+            "ruptureMode": sim.ruptureMode,
+            "ruptureForce": sim.ruptureForce,
+            "forceInterval": sim.forceInterval,
+            "solverIterations": [sim.velocityIterations, sim.positionIterations],
+            "solverFloor": list(sim.solverFloor),
+            "adaptiveSolver": sim.adaptiveSolver,
+            "solverTolerance": sim.solverTolerance,
+            "solverRaise": sim.solverRaise,
+            "solverStuck": sim.solverStuck,
+            "freezing": [sim.freezing, sim.freezeBonds, sim.freezeSpeed],
+            "tempField": None if sim.tempField is None else sim.tempField.toDict(),
+            "dissociationField": None if sim.dissociationField is None else sim.dissociationField.toDict(),
+            "arrhenius": sim.arrhenius,
+            "association": [[list(r) for r in sim.associationRules], sim.associationActivation, sim.associationReference],
+        },
+        "groups": [groupToDict(g) for g in sim.groups],
+        "bondCapacity": bonds.capacity,
+        "rng": sim.rng.bit_generator.state,
+        "extra": extra,
+    }
+
+    bodies = sim.bodies
+    columns = {
+        "header": np.array(json.dumps(header)),
+        "particle_group": np.array(sim.groupIndex, dtype=np.int16),
+        "particle_pos": sim.positions(),
+        "particle_angle": np.array([b.angle for b in bodies]),
+        "particle_vel": sim.velocities(),
+        "particle_angvel": np.array([b.angularVelocity for b in bodies]),
+        "bond_id": ids.astype(np.int32),
+        "bond_pA": bonds.pA[ids],
+        "bond_pB": bonds.pB[ids],
+        "bond_point": bonds.point[ids],
+        "bond_newbond": bonds.newbond[ids],
+        "bond_broken": bonds.broken[ids],
+        "bond_cooldown": bonds.cooldown[ids],
+        "bond_force": bonds.force[ids],
+        "bond_contact_anchor": bonds.contactAnchor[ids],
+        "contact_pairs": sim.touchingPairs(),
+    }
+
+    # the definition of every joint, NaN for bonds without one
+    m = len(ids)
+    anchorA = np.full((m, 2), np.nan)
+    anchorB = np.full((m, 2), np.nan)
+    length = np.full(m, np.nan)
+    frequency = np.full(m, np.nan)
+    damping = np.full(m, np.nan)
+    collide = np.zeros(m, dtype=bool)
+    for k, bondID in enumerate(ids.tolist()):
+        joint = bonds.joints[bondID]
+        if joint is None:
+            continue
+        anchorA[k] = joint.GetLocalAnchorA().tuple
+        anchorB[k] = joint.GetLocalAnchorB().tuple
+        length[k] = joint.length
+        frequency[k] = joint.frequency
+        damping[k] = joint.dampingRatio
+        collide[k] = joint.collideConnected
+    columns.update({
+        "joint_anchorA": anchorA,
+        "joint_anchorB": anchorB,
+        "joint_length": length,
+        "joint_frequency": frequency,
+        "joint_damping": damping,
+        "joint_collide": collide,
+    })
+
+    buffer = io.BytesIO()
+    if compress:
+        np.savez_compressed(buffer, **columns)
+    else:
+        np.savez(buffer, **columns)
+
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(buffer.getbuffer())
+    os.replace(tmp, path)
+
+    return header
+
+
+def restoreCheckpoint(sim, path):
+    """Replace the state of sim with the checkpoint at path
+
+    sim must have the same world size as the saved simulation. Returns the
+    extra data saved with the checkpoint.
+    """
+    with np.load(path) as data:
+        header = json.loads(str(data["header"]))
+        if header["version"] != CHECKPOINT_VERSION:
+            raise ValueError("Unsupported checkpoint version: {}".format(header["version"]))
+        if (header["width"], header["height"]) != (sim.width, sim.height):
+            raise ValueError("Checkpoint world is {0}x{1}, not {2}x{3}".format(
+                header["width"], header["height"], sim.width, sim.height))
+        columns = {k: data[k] for k in data.files if k != "header"}
+    sim.logInput("restoreCheckpoint", path)
+
+    # empty the world
+    sim.clearBonds()
+    for p in sim.particles:
+        sim.world.DestroyBody(p.body)
+
+    # parameters
+    params = header["params"]
+    sim.dissociationRate = params["dissociationRate"]
+    sim.dissociationChance = params["dissociationChance"]
+    sim.jointCooldown = params["jointCooldown"]
+    sim.temp = params["temp"]
+    sim.stiffness = params["stiffness"]
+    sim.anchorContact = params["anchorContact"]
+    # joints still waiting for a rebuild are picked up again by the next step
+    sim.jointsStale = True
+    sim.ruptureMode = params["ruptureMode"]
+    sim.ruptureForce = params["ruptureForce"]
+    sim.forceInterval = params["forceInterval"]
+    sim.velocityIterations, sim.positionIterations = params["solverIterations"]
+    sim.solverFloor = tuple(params["solverFloor"])
+    sim.adaptiveSolver = params["adaptiveSolver"]
+    sim.solverTolerance = params["solverTolerance"]
+    raised = params["solverRaise"]
+    sim.solverRaise = None if raised is None else (raised[0], tuple(raised[1]))
+    sim.solverStuck = params["solverStuck"]
+    # every particle comes back dynamic, the next freeze check refreezes them
+    sim.freezing, sim.freezeBonds, sim.freezeSpeed = params["freezing"]
+    fields = [params[k] for k in ("tempField", "dissociationField")]
+    sim.tempField, sim.dissociationField = [None if f is None else Field.fromDict(f) for f in fields]
+    sim.arrhenius = None if params["arrhenius"] is None else tuple(params["arrhenius"])
+    # the probabilities of every group pair are rebuilt with the particles below
+    rules, sim.associationActivation, sim.associationReference = params["association"]
+    sim.associationRules = [tuple(r) for r in rules]
+    sim.world.gravity = tuple(header["gravity"])
+    sim.steps = header["steps"]
+    sim.seed = header["seed"]
+    sim.rng.bit_generator.state = header["rng"]
+
+    # particles
+    sim.groups = [groupFromDict(g) for g in header["groups"]]
+    sim.particles = []
+    for g, pos, angle, vel, angvel in zip(columns["particle_group"].tolist(), columns["particle_pos"].tolist(),
+                                          columns["particle_angle"].tolist(), columns["particle_vel"].tolist(),
+                                          columns["particle_angvel"].tolist()):
+        p = Particle(sim.groups[g], sim.world, pos, vel, angle)
+        p.body.angularVelocity = angvel
+        sim.particles.append(p)
+    sim.indexParticles()
+    sim.oldContacts = columns["contact_pairs"]
+
+    # bonds keep their IDs
+    bonds = sim.bonds
+    bonds.grow(header["bondCapacity"])
+    ids = columns["bond_id"]
+    bonds.alive[ids] = True
+    bonds.pA[ids] = columns["bond_pA"]
+    bonds.pB[ids] = columns["bond_pB"]
+    bonds.point[ids] = columns["bond_point"]
+    bonds.newbond[ids] = columns["bond_newbond"]
+    bonds.broken[ids] = columns["bond_broken"]
+    bonds.cooldown[ids] = columns["bond_cooldown"]
+    bonds.force[ids] = columns["bond_force"]
+    bonds.contactAnchor[ids] = columns["bond_contact_anchor"]
+    bonds.collide[ids] = columns["joint_collide"]
+    bonds.rebuildIndex()
+    intact = bonds.ids(~bonds.broken)
+    sim.clusters.rebuild(len(sim.particles), zip(bonds.pA[intact].tolist(), bonds.pB[intact].tolist()))
+
+    bodies = sim.bodies
+    for k, bondID in enumerate(ids.tolist()):
+        length = columns["joint_length"][k]
+        if np.isnan(length):
+            continue
+        joint = sim.world.CreateDistanceJoint(
+            bodyA=bodies[bonds.pA[bondID]],
+            bodyB=bodies[bonds.pB[bondID]],
+            localAnchorA=columns["joint_anchorA"][k].tolist(),
+            localAnchorB=columns["joint_anchorB"][k].tolist(),
+            length=float(length),
+            frequencyHz=float(columns["joint_frequency"][k]),
+            dampingRatio=float(columns["joint_damping"][k]),
+            collideConnected=bool(columns["joint_collide"][k]),
+            )
+        bonds.joints[bondID] = joint
+
+    return header["extra"]
+
+
+def loadCheckpoint(path):
+    """Create a new Simulation from the checkpoint at path"""
+    with np.load(path) as data:
+        header = json.loads(str(data["header"]))
+    sim = Simulation(header["width"], header["height"])
+    restoreCheckpoint(sim, path)
+    return sim
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+Bonded cluster tracking.
+
+The clusters are the connected components of the graph whose edges are the
+intact bonds. They are kept up to date one bond at a time instead of being
+recomputed every frame:
+
+    a new bond between two clusters relabels the smaller one into the
+    larger (union by size), so a particle changes label at most log2(N)
+    times while clusters only grow.
+
+    a broken bond starts a breadth-first search from both of its ends at
+    once, one particle per side in turn. If the searches meet, the cluster
+    is still connected. If one of them runs out first, it has found the
+    piece that split off, and only that smaller piece is relabeled.
+
+The count, size histogram and largest size are updated along the way, so
+reading them costs nothing.
+
+"""
+
+from collections import deque
+
+
+class ClusterTracker():
+    def __init__(self, n=0):
+        self.reset(n)
+
+    def reset(self, n):
+        """Start over with n particles and no bonds"""
+        self.n = n
+        self.label = list(range(n)) # cluster label of each particle
+        self.members = {i: {i} for i in range(n)} # label -> particle indices
+        self.neighbours = [set() for _ in range(n)] # bonded particles of each particle
+        self.sizeCount = {1: n} if n else {} # cluster size -> number of clusters that size
+        self.largest = 1 if n else 0
+        self.nextLabel = n
+
+    def rebuild(self, n, pairs):
+        """Start over with n particles bonded by the given (a, b) pairs"""
+        self.reset(n)
+        for a, b in pairs:
+            self.addBond(a, b)
+
+    def addBond(self, a, b):
+        self.neighbours[a].add(b)
+        self.neighbours[b].add(a)
+
+        keep, gone = self.label[a], self.label[b]
+        if keep == gone:
+            return
+        if len(self.members[keep]) < len(self.members[gone]):
+            keep, gone = gone, keep
+
+        moved = self.members.pop(gone)
+        for i in moved:
+            self.label[i] = keep
+        big = self.members[keep]
+        self.resized(len(big), len(big) + len(moved))
+        self.resized(len(moved), None)
+        big |= moved
+
+    def removeBond(self, a, b):
+        if b not in self.neighbours[a]:
+            return
+        self.neighbours[a].discard(b)
+        self.neighbours[b].discard(a)
+
+        piece = self.splitOff(a, b)
+        if piece is None:
+            return
+
+        old = self.label[a]
+        rest = self.members[old]
+        self.resized(len(rest), len(rest) - len(piece))
+        self.resized(None, len(piece))
+        rest -= piece
+
+        new = self.nextLabel
+        self.nextLabel += 1
+        self.members[new] = piece
+        for i in piece:
+            self.label[i] = new
+
+    def splitOff(self, a, b):
+        """The smaller piece if a and b are no longer connected, else None"""
+        neighbours = self.neighbours
+        # breadth first, since a broken bond usually has a short way around
+        queues = (deque([a]), deque([b]))
+        seen = ({a}, {b})
+        while True:
+            for side in (0, 1):
+                queue = queues[side]
+                if not queue:
+                    return seen[side]
+                mine, other = seen[side], seen[1 - side]
+                for j in neighbours[queue.popleft()]:
+                    if j in other:
+                        return None
+                    if j not in mine:
+                        mine.add(j)
+                        queue.append(j)
+
+    def resized(self, old, new):
+        """Move one cluster from size old to size new in the histogram"""
+        count = self.sizeCount
+        if old is not None:
+            count[old] -= 1
+            if count[old] == 0:
+                del count[old]
+        if new is not None:
+            count[new] = count.get(new, 0) + 1
+            if new > self.largest:
+                self.largest = new
+        if self.largest not in count:
+            self.largest = max(count) if count else 0
+
+    def count(self):
+        """Number of clusters, counting unbonded particles as clusters of one"""
+        return len(self.members)
+
+    def histogram(self):
+        """Dict of cluster size -> number of clusters of that size"""
+        return dict(self.sizeCount)
+
+    def largestFraction(self):
+        """Fraction of all particles in the largest cluster"""
+        return self.largest/self.n if self.n else 0.0
+
+    def clusterOf(self, i):
+        """Indices of the particles in the same cluster as particle i"""
+        return self.members[self.label[i]]
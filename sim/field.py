@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""
+Values that vary across the world, such as a temperature gradient.
+
+A Field is a grid of values spread evenly over the world, from the corner
+(0, 0) to (width, height), with grid points on both edges. Values in
+between are interpolated bilinearly, for many positions at once, and
+positions outside the world take the value at the nearest edge.
+
+    Field(values, width, height)       any (rows, columns) array, row 0 at y = 0
+    Field.linear(...)                  a straight gradient along x or y
+    Field.radial(...)                  one value in the middle, another at the corners
+
+"""
+
+import numpy as np
+
+
+class Field():
+    def __init__(self, values, width, height):
+        self.values = np.array(values, dtype=float, ndmin=2)
+        self.width = width
+        self.height = height
+
+    @classmethod
+    def linear(cls, width, height, start, end, axis="x"):
+        """From start at the left (bottom for axis "y") to end at the right (top)"""
+        values = np.array([start, end], dtype=float)
+        return cls(values[None, :] if axis == "x" else values[:, None], width, height)
+
+    @classmethod
+    def radial(cls, width, height, center, edge, points=33):
+        """From center in the middle of the world to edge at its corners"""
+        x = np.linspace(-1, 1, points)
+        r = np.minimum(np.hypot(x[None, :], x[:, None])/np.sqrt(2), 1)
+        return cls(center + (edge - center)*r, width, height)
+
+    def sample(self, pos):
+        """The interpolated value at each of the (N, 2) positions"""
+        pos = np.asarray(pos, dtype=float).reshape(-1, 2)
+        rows, cols = self.values.shape
+        gx = np.clip(pos[:, 0]/self.width, 0, 1)*(cols - 1)
+        gy = np.clip(pos[:, 1]/self.height, 0, 1)*(rows - 1)
+        x0 = np.minimum(gx.astype(np.int64), max(cols - 2, 0))
+        y0 = np.minimum(gy.astype(np.int64), max(rows - 2, 0))
+        x1 = np.minimum(x0 + 1, cols - 1)
+        y1 = np.minimum(y0 + 1, rows - 1)
+        tx = gx - x0
+        ty = gy - y0
+
+        v = self.values
+        bottom = v[y0, x0]*(1 - tx) + v[y0, x1]*tx
+        top = v[y1, x0]*(1 - tx) + v[y1, x1]*tx
+        return bottom*(1 - ty) + top*ty
+
+    def toDict(self):
+        """JSON friendly form of the field"""
+        return {"values": self.values.tolist(), "width": self.width, "height": self.height}
+
+    @classmethod
+    def fromDict(cls, d):
+        return cls(d["values"], d["width"], d["height"])
@@ -2,6 +2,25 @@
 
 import pygame
 
+# fonts by size and rendered text surfaces by (text, size, color)
+fontCache = {}
+textCache = {}
+
+def getFont(size):
+    if size not in fontCache:
+        fontCache[size] = pygame.font.Font(None, size)
+    return fontCache[size]
+
+def renderText(text, size, color):
+    key = (text, size, tuple(pygame.Color(color)))
+    if key not in textCache:
+        textCache[key] = getFont(size).render(text, True, color)
+    return textCache[key]
+
+def forgetText(text, size, color):
+    textCache.pop((text, size, tuple(pygame.Color(color))), None)
+
+
 class Element():
     def __init__(self, pos):
         self.pos = pos
@@ -13,6 +32,7 @@ class Element():
         self.key = None
         self.fontSize = 20
         self.fontColor = (0,0,0)
+        self.dirty = True # needs to be drawn again
     
     def collide(self, pos):
         if self.rect is not None:
@@ -32,8 +52,7 @@ class Element():
                     pygame.draw.rect(screen, self.color, self.rect)
             
             elif isinstance(s, str):
-                base_font = pygame.font.Font(None, self.fontSize)
-                text_surface = base_font.render(s, True, self.fontColor)
+                text_surface = renderText(s, self.fontSize, self.fontColor)
                 
                 x0 = self.pos[0]
                 y0 = self.pos[1]
@@ -44,6 +63,7 @@ class Element():
                         x0 = x0 + (self.width - text_surface.get_width())/2
                 
                 screen.blit(text_surface, (x0, y0))
+        self.dirty = False
 
 
 class Button(Element):
@@ -70,6 +90,7 @@ class Button(Element):
         self.activeColor = self.color
         
     def handle(self, event):
+        self.dirty = True
         if event.type == pygame.locals.MOUSEBUTTONDOWN:
             self.value = not self.value
             self.data[self.key] = self.value
@@ -94,6 +115,14 @@ class Button(Element):
                 else:
                     self.color=pygame.Color(255, 255, 255)
                     self.activeColor=pygame.Color(255, 255, 255)
+    
+    def setValue(self, value):
+        # change the state without calling onpress
+        self.value = value
+        self.data[self.key] = value
+        self.color = pygame.Color(180,200,255) if value else pygame.Color(255, 255, 255)
+        self.activeColor = self.color
+        self.dirty = True
             
 class TextInput(Element):
     def __init__(self, pos, width, height, key="text", value="", data={}):
@@ -114,6 +143,8 @@ class TextInput(Element):
     def handle(self, event):
         if event.type == pygame.locals.KEYDOWN:
             self.shapes.remove(self.value)
+            forgetText(self.value, self.fontSize, self.fontColor)
+            self.dirty = True
             if event.key == pygame.K_BACKSPACE:
                 self.value = self.value[:-1]
                 
@@ -123,6 +154,14 @@ class TextInput(Element):
                 self.value = temp
             self.data[self.key] = self.value
             self.shapes.append(self.value)
+    
+    def setValue(self, value):
+        self.shapes.remove(self.value)
+        forgetText(self.value, self.fontSize, self.fontColor)
+        self.value = value
+        self.data[self.key] = value
+        self.shapes.append(value)
+        self.dirty = True
 
 
 class NumInput(TextInput):
@@ -135,6 +174,8 @@ class NumInput(TextInput):
         # override the handler to check for number length
         if event.type == pygame.locals.KEYDOWN:
             self.shapes.remove(self.value)
+            forgetText(self.value, self.fontSize, self.fontColor)
+            self.dirty = True
             if event.key == pygame.K_BACKSPACE:
                 self.value = self.value[:-1]
                 
@@ -192,7 +233,7 @@ class GroupInput(Element):
             NumInput((cols[1],inputY),inputWidth, inputHeight, key="radius", value="0.5", kind=float, highLim=10, data=self.internalData),
             NumInput((cols[2],inputY),inputWidth, inputHeight, key="mass", value="1", kind=float, highLim=100, data=self.internalData),
             TextInput((cols[3],inputY),inputWidth, inputHeight, key="connections", value=str(self.groupID), data=self.internalData),
-            NumInput((self.width - inputWidth,inputY),inputWidth, inputHeight, key="num", value="400", kind=int, highLim=5000, data=self.internalData)
+            NumInput((self.width - inputWidth,inputY),inputWidth, inputHeight, key="num", value="400", kind=int, highLim=100000, data=self.internalData)
             ]
         
         
@@ -268,6 +309,10 @@ class GUI():
         # create button to pause and play simulation
         self.addElement(Button((65,5),50,20, text="II", onpress=self.togglePausePlay, key="paused", value=False, data=self.inputVars),False)
         
+        # fast forward: as many physics steps as fit between fewer frames
+        self.fastForwardBtn = Button((125,5),50,20, text=">>", onpress=self.noneCallback, key="fastForward", value=False, data=self.inputVars)
+        self.addElement(self.fastForwardBtn,False)
+        
         
         self.visible = True
         self.updated = True
@@ -318,6 +363,10 @@ class GUI():
         
         # row 6: button options:
         self.addElement(Button((leftAlign,rowy[5]),150,20, text="Allow Bond Rotation", onpress=self.noneCallback, key="allowRotation", value=True, instant=False, data=self.inputVars))
+
+        # row 7: physics steps per rendered frame
+        self.addElement(Label((leftAlign, rowy[6]), height=rowHeight, size=20, text="Steps per frame:"))
+        self.addElement(NumInput((rightAlign-numInputWidth, rowy[6]), numInputWidth, rowHeight, key="renderInterval", value="1", highLim=100, kind=int, data=self.inputVars))
         
         
         r = 7
@@ -355,6 +404,7 @@ class GUI():
                 self.screenElements.remove(element)
         
     def togglePausePlay(self, val, button):
+        button.dirty = True
         button.shapes.remove(button.text)
         if val:
             button.text="II"
@@ -364,6 +414,7 @@ class GUI():
     
     def toggleVisible(self, val, button):
         self.visible = val
+        self.updated = True
     
     def noneCallback(self, val, button):
         pass
@@ -389,6 +440,9 @@ class GUI():
             for el in g.elements:
                 self.addElement(el)
         
+        # rows may have gone, so repaint the whole menu
+        self.updated = True
+        
         
     def handleClick(self, event):
         #if self.element[0].collide():
@@ -399,8 +453,10 @@ class GUI():
                 if event.type == pygame.locals.MOUSEBUTTONDOWN:
                     self.prevElement = self.activeElement
                     self.prevElement.active = False
+                    self.prevElement.dirty = True
                     self.activeElement = e
                     e.active = True
+                    e.dirty = True
                     #print("active element:" + (e.key if e.key is not None else "None"))
                 e.handle(event)
                 
@@ -411,12 +467,13 @@ class GUI():
                     if event.type == pygame.locals.MOUSEBUTTONDOWN:
                         self.prevElement = self.activeElement
                         self.prevElement.active = False
+                        self.prevElement.dirty = True
                         self.activeElement = e
                         e.active = True
+                        e.dirty = True
                         #print("active element:" + (e.key if e.key is not None else "None"))
                     
                     e.handle(event)
-                    self.updated = True
         #if not collided:
         #    self.prevElement = self.screenElements[0]
         #    if self.prevElement is not None:
@@ -429,22 +486,61 @@ class GUI():
         for e in elements:
             if e.active and isinstance(e, TextInput):
                 e.handle(event)
-                self.updated = True
     
     
+    def menuInputs(self):
+        # inputs and toggle buttons of the menu itself, not of the group rows
+        return [e for e in self.surfaceElements if isinstance(e, (TextInput, Button))
+                and e.data is self.inputVars and not getattr(e, "instant", False)]
+    
+    def getState(self):
+        """Values of the menu inputs, to keep with a checkpoint"""
+        state = {e.key: e.value for e in self.menuInputs()}
+        state["groups"] = [dict(g.internalData) for g in self.groupRows]
+        return state
+    
+    def setState(self, state):
+        """Put back menu values saved by getState"""
+        for e in self.menuInputs():
+            if e.key in state:
+                e.setValue(state[e.key])
+        self.makeGroupRows()
+        for g, values in zip(self.groupRows, state.get("groups", [])):
+            for e in g.elements:
+                if isinstance(e, TextInput) and e.key in values:
+                    e.setValue(values[e.key])
+        self.updated = True
+    
+    def dirtyRects(self):
+        """Screen rects the next draw changes: the whole menu if anything on it changed, and the changed buttons
+        
+        The menu is see-through, so it can only be drawn again over a fresh copy of what is under all of it.
+        """
+        rects = [e.rect for e in self.screenElements if (e.dirty or self.updated) and e.rect is not None]
+        if self.visible and (self.updated or any(e.dirty for e in self.surfaceElements)):
+            rects.append(pygame.Rect(self.pos, (self.width, self.height)))
+        return rects
+    
     def draw(self):
+        """Draw the menu, re-rendering only the widgets that changed"""
         if self.visible:
-            # only redraw if an event has been handled
+            background = self.surfaceElements[0]
             if self.updated:
+                # repaint the whole menu
                 for e in self.surfaceElements:
                     e.draw(self.surface)
-                    self.updated = False
+            else:
+                for e in self.surfaceElements[1:]:
+                    if e.dirty and e.rect is not None:
+                        pygame.draw.rect(self.surface, background.color, e.rect)
+                        e.draw(self.surface)
             self.screen.blit(self.surface, self.pos)
         
         #draw the hide/show button to the main screen
         for e in self.screenElements:
             e.draw(self.screen)
+        self.updated = False
         
-        
+
 
 
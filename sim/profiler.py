@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+Built-in timing of the simulation and window loops.
+
+The profiler works like a stopwatch with laps: begin() starts the clock and
+each lap(name) adds the time since the previous lap to the phase name.
+Counters (contacts, bonds made and broken, ...) are added with count().
+Everything is summed into the current sample until endSample() files it
+away. The last window samples are kept for rolling statistics, which
+stats() reports per step so that runs with different numbers of steps per
+sample can be compared.
+
+A disabled profiler returns from every call right away, so the hooks can
+stay in the hot paths.
+
+"""
+
+import csv, json, time
+from collections import deque
+
+
+class PhaseProfiler():
+    def __init__(self, window=300, enabled=False):
+        self.enabled = enabled
+        self.phases = [] # phase names in the order they were first seen
+        self.counters = [] # counter names, likewise
+        self.samples = deque(maxlen=window) # (steps, phase times, counts)
+        self.times = {}
+        self.counts = {}
+        self.last = time.perf_counter()
+
+    def begin(self):
+        if self.enabled:
+            self.last = time.perf_counter()
+
+    def lap(self, name):
+        """Add the time since the last lap or begin to phase name"""
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        if name not in self.times:
+            self.times[name] = 0.0
+            if name not in self.phases:
+                self.phases.append(name)
+        self.times[name] += now - self.last
+        self.last = now
+
+    def count(self, name, k=1):
+        if not self.enabled:
+            return
+        if name not in self.counts:
+            self.counts[name] = 0
+            if name not in self.counters:
+                self.counters.append(name)
+        self.counts[name] += k
+
+    def endSample(self, steps=1):
+        """File the phases and counts since the last sample, covering steps timesteps"""
+        if not self.enabled:
+            return
+        self.samples.append((steps, self.times, self.counts))
+        self.times = {}
+        self.counts = {}
+
+    def discard(self):
+        """Drop the phases and counts since the last sample"""
+        self.times = {}
+        self.counts = {}
+
+    def clear(self):
+        self.samples.clear()
+        self.times = {}
+        self.counts = {}
+
+    def stats(self):
+        """Rolling statistics over the kept samples
+
+        Returns a dict with the number of steps covered, the steps per
+        second of wall time spent in the timed phases, and for every phase
+        its mean and worst milliseconds per step and its share of the time.
+        Counters get their mean per step and their total.
+        """
+        steps = sum(s for s, _, _ in self.samples)
+        totals = {name: sum(t.get(name, 0.0) for _, t, _ in self.samples) for name in self.phases}
+        wall = sum(totals.values())
+        result = {
+            "steps": steps,
+            "stepsPerSecond": steps/wall if wall > 0 else 0.0,
+            "phases": {},
+            "counters": {},
+        }
+        for name in self.phases:
+            worst = max((t.get(name, 0.0)/s for s, t, _ in self.samples if s), default=0.0)
+            result["phases"][name] = {
+                "msPerStep": 1000*totals[name]/steps if steps else 0.0,
+                "worstMsPerStep": 1000*worst,
+                "share": totals[name]/wall if wall > 0 else 0.0,
+            }
+        for name in self.counters:
+            total = sum(c.get(name, 0) for _, _, c in self.samples)
+            result["counters"][name] = {"perStep": total/steps if steps else 0.0, "total": total}
+        return result
+
+    def lines(self):
+        """The rolling statistics as short lines of text"""
+        stats = self.stats()
+        lines = ["{0:.0f} steps/s over {1} steps".format(stats["stepsPerSecond"], stats["steps"])]
+        for name, p in stats["phases"].items():
+            lines.append("{0:<10} {1:7.2f} ms {2:6.1%}  (worst {3:.2f} ms)".format(
+                name, p["msPerStep"], p["share"], p["worstMsPerStep"]))
+        for name, c in stats["counters"].items():
+            lines.append("{0:<14} {1:8.2f} /step".format(name, c["perStep"]))
+        return lines
+
+    def writeCSV(self, path):
+        """One row per kept sample with the milliseconds of every phase and the counts"""
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["sample", "steps"] + ["{}_ms".format(p) for p in self.phases] + self.counters)
+            for k, (steps, times, counts) in enumerate(self.samples):
+                writer.writerow([k, steps] + [1000*times.get(p, 0.0) for p in self.phases]
+                                + [counts.get(c, 0) for c in self.counters])
+
+    def writeJSON(self, path):
+        with open(path, "w") as f:
+            json.dump(self.stats(), f, indent=2)
+
+    def write(self, path):
+        """writeJSON for .json paths, writeCSV for anything else"""
+        if path.endswith(".json"):
+            self.writeJSON(path)
+        else:
+            self.writeCSV(path)
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+Batched particle drawing for the pygame front-end.
+
+The window is a viewport onto the world: a Camera holds the world point at
+the middle of the screen and the zoom in pixels per meter, so the world can
+be much larger than the screen. A frame only touches the particles inside
+the view. While the view covers a small part of the world they are found
+with a query of Box2D's broadphase tree; once it covers most of the world,
+reading every position at once and culling with NumPy is cheaper.
+
+Each particle group gets one pre-rendered circle sprite per zoom level, and
+all visible particles are drawn with a single Surface.blits call.
+
+"""
+
+import numpy as np
+import pygame
+
+MIN_PPM, MAX_PPM = 0.5, 200.0 # zoom limits in pixels per meter
+QUERY_FRACTION = 0.3 # largest share of the world for which the view is queried instead of scanned
+
+
+class Camera():
+    def __init__(self, screenSize, ppm, center=(0, 0)):
+        self.width, self.height = screenSize
+        self.ppm = ppm
+        self.center = np.array(center, dtype=float)
+
+    def fit(self, width, height):
+        """Zoom and pan to show a whole world of the given size"""
+        self.ppm = min(max(min(self.width/width, self.height/height), MIN_PPM), MAX_PPM)
+        self.center = np.array((width/2, height/2))
+
+    def toScreen(self, pos):
+        """Screen pixel coordinates of (N, 2) world positions, y pointing down"""
+        pos = np.asarray(pos, dtype=float)
+        screen = np.empty(pos.shape)
+        screen[..., 0] = (pos[..., 0] - self.center[0])*self.ppm + self.width/2
+        screen[..., 1] = self.height/2 - (pos[..., 1] - self.center[1])*self.ppm
+        return screen
+
+    def toWorld(self, screenPos):
+        x, y = screenPos
+        return np.array((self.center[0] + (x - self.width/2)/self.ppm,
+                         self.center[1] - (y - self.height/2)/self.ppm))
+
+    def view(self):
+        """The visible part of the world, ((xmin, xmax), (ymin, ymax))"""
+        (xmin, ymax), (xmax, ymin) = self.toWorld((0, 0)), self.toWorld((self.width, self.height))
+        return ((xmin, xmax), (ymin, ymax))
+
+    def pan(self, dx, dy):
+        """Move the view with a drag of dx, dy pixels"""
+        self.center += (-dx/self.ppm, dy/self.ppm)
+
+    def zoomAt(self, screenPos, factor):
+        """Zoom by factor, keeping the world point under screenPos in place"""
+        anchor = self.toWorld(screenPos)
+        self.ppm = min(max(self.ppm*factor, MIN_PPM), MAX_PPM)
+        self.center += anchor - self.toWorld(screenPos)
+
+
+class ParticleRenderer():
+    def __init__(self, camera):
+        self.camera = camera
+        self.sprites = {} # (pixel radius, color) -> circle sprite
+        self.groups = []
+        self.groupIndex = np.zeros(0, dtype=np.int64) # group of each particle, in particle order
+        self.maxRadius = 0
+
+    def sprite(self, group, ppm):
+        """The circle sprite of a group at a zoom level, drawn on first use"""
+        r = int(group.radius * ppm)
+        key = (r, str(group.color))
+        if key not in self.sprites:
+            surface = pygame.Surface((2*r+1, 2*r+1))
+            surface.set_colorkey((0,0,0))
+            if r == 0:
+                surface.fill(group.color)
+            else:
+                pygame.draw.circle(surface, group.color, (r, r), r)
+            self.sprites[key] = surface.convert()
+            self.sprites[key].set_colorkey((0,0,0), pygame.RLEACCEL)
+        return self.sprites[key]
+
+    def prepare(self, sim):
+        """Note the group of every particle, call after each reset"""
+        self.groups = list(sim.groups)
+        self.groupIndex = np.asarray(sim.groupIndex, dtype=np.int64)
+        self.maxRadius = max((g.radius for g in self.groups), default=0)
+
+    def visible(self, sim):
+        """Indices and positions of the particles in view"""
+        (xmin, xmax), (ymin, ymax) = self.camera.view()
+        # widen the view so particles cut by its edge are still drawn
+        xmin, xmax, ymin, ymax = xmin - self.maxRadius, xmax + self.maxRadius, ymin - self.maxRadius, ymax + self.maxRadius
+
+        shown = max(0, min(xmax, sim.width) - max(xmin, 0))*max(0, min(ymax, sim.height) - max(ymin, 0))
+        if shown < QUERY_FRACTION*sim.width*sim.height:
+            indices = sim.query(((xmin, xmax), (ymin, ymax)))
+            return indices, sim.positions(indices)
+
+        pos = sim.positions()
+        inside = np.flatnonzero((pos[:, 0] > xmin) & (pos[:, 0] < xmax) & (pos[:, 1] > ymin) & (pos[:, 1] < ymax))
+        return inside, pos[inside]
+
+    def draw(self, screen, sim):
+        """Draw the world border and every particle in view"""
+        camera = self.camera
+        (left, top), (right, bottom) = camera.toScreen([(0, sim.height), (sim.width, 0)]).astype(int)
+        pygame.draw.rect(screen, "grey", (left, top, right - left, bottom - top), 1)
+
+        if not self.groups or len(self.groupIndex) == 0:
+            return
+        indices, pos = self.visible(sim)
+        if len(indices) == 0:
+            return
+
+        sprites = [self.sprite(g, camera.ppm) for g in self.groups]
+        offsets = np.array([int(g.radius * camera.ppm) for g in self.groups])
+        groups = self.groupIndex[indices]
+
+        # top left corner of each sprite
+        corners = camera.toScreen(pos).astype(np.int64) - offsets[groups][:, None]
+        screen.blits(zip([sprites[g] for g in groups.tolist()], corners.tolist()), doreturn=False)
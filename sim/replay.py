@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Recording and replaying the inputs of a run.
+
+Every random number of a simulation comes from its own generator, seeded
+with Simulation.seed, so a run is fully determined by its seed, its world
+size and the calls that changed it: the set* methods, reset and checkpoint
+restores, each with the step it happened at. An InputLog attached to a
+simulation records those calls, and replay() feeds them to a fresh
+simulation at the same steps, which repeats the run exactly on the same
+machine and library versions.
+
+Setters are called every frame by the window, so a setter call is only
+recorded when its arguments differ from the last recorded ones. A
+restored checkpoint is copied next to itself under a name made from its
+contents, and the log refers to the copy, so saving to the same path
+later (the window's autosave does) doesn't change what a replay restores.
+
+Usage: python replay.py run_log.json [--steps N] [--save checkpoint.npz]
+
+"""
+
+import hashlib, json, os, shutil
+
+from field import Field
+from simulation import (Simulation, groupToDict, groupFromDict)
+
+LOG_VERSION = 1
+
+SETTERS = ("setDissociationRate", "setCooldown", "setGravity", "setTemp", "setStiffness",
+           "setAnchorContact", "setRupture", "setSolverIterations", "setFreezing",
+           "setTempField", "setDissociationField", "setArrhenius", "setAssociation")
+FIELD_SETTERS = ("setTempField", "setDissociationField") # called with a Field or None
+
+
+class InputLog():
+    def __init__(self, sim):
+        """Start recording the inputs of sim"""
+        self.sim = sim
+        self.header = {
+            "version": LOG_VERSION,
+            "seed": sim.seed,
+            "width": sim.width,
+            "height": sim.height,
+        }
+        self.events = [] # [step, method, args]
+        self.last = {} # setter -> last recorded args
+        sim.inputLog = self
+
+    def record(self, step, method, args):
+        if method == "reset":
+            args = ([groupToDict(g) for g in args[0]],) + tuple(args[1:])
+            # reset and restores change state behind the setters' backs
+            self.last.clear()
+        elif method == "restoreCheckpoint":
+            self.last.clear()
+            args = (snapshot(args[0]),)
+        elif method in FIELD_SETTERS:
+            args = [None if a is None else a.toDict() for a in args]
+        args = list(args)
+
+        if method in SETTERS:
+            if self.last.get(method) == args:
+                return
+            self.last[method] = args
+        self.events.append([step, method, args])
+
+    def save(self, path):
+        log = dict(self.header, endStep=self.sim.steps, events=self.events)
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(log, f)
+        os.replace(tmp, path)
+
+
+def snapshot(path):
+    """Path of a copy of the file at path, named after its contents"""
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    root, ext = os.path.splitext(path)
+    copy = "{0}.{1}{2}".format(root, digest.hexdigest()[:12], ext)
+    if not os.path.exists(copy):
+        shutil.copyfile(path, copy)
+    return copy
+
+def loadLog(path):
+    with open(path) as f:
+        log = json.load(f)
+    if log["version"] != LOG_VERSION:
+        raise ValueError("Unsupported input log version: {}".format(log["version"]))
+    return log
+
+def applyInput(sim, method, args):
+    if method == "reset":
+        sim.reset([groupFromDict(g) for g in args[0]], *args[1:])
+    elif method == "restoreCheckpoint":
+        from checkpoint import restoreCheckpoint
+        restoreCheckpoint(sim, args[0])
+    elif method in FIELD_SETTERS:
+        getattr(sim, method)(*[None if a is None else Field.fromDict(a) for a in args])
+    elif method in SETTERS:
+        getattr(sim, method)(*args)
+    else:
+        raise ValueError("Unknown input in log: {}".format(method))
+
+def replay(log, steps=None):
+    """Repeat a logged run and return its simulation
+
+    The run goes on to the step the log was saved at, or stops at steps if
+    given. A restored checkpoint can set the step count back, so steps only
+    makes sense for logs without restores.
+    """
+    sim = Simulation(log["width"], log["height"], seed=log["seed"])
+    end = log["endStep"] if steps is None else steps
+    for step, method, args in log["events"]:
+        if steps is not None and step > steps:
+            break
+        if step > sim.steps:
+            sim.step(step - sim.steps)
+        applyInput(sim, method, args)
+    if end > sim.steps:
+        sim.step(end - sim.steps)
+    return sim
+
+
+if __name__ == "__main__":
+    import argparse, time
+
+    parser = argparse.ArgumentParser(description="Repeat a run from its input log")
+    parser.add_argument("log", help="input log written by the window or by simulation.py --log")
+    parser.add_argument("--steps", type=int, default=None, help="stop at this step instead of the end of the log")
+    parser.add_argument("--save", default=None, help="save a checkpoint of the final state")
+    args = parser.parse_args()
+
+    log = loadLog(args.log)
+    start = time.perf_counter()
+    sim = replay(log, args.steps)
+    print("Replayed {0} inputs to t={1:.1f}s in {2:.1f}s: There are {3} bonds, {4} clusters".format(
+        len(log["events"]), sim.time(), time.perf_counter() - start, len(sim.bonds), sim.clusters.count()))
+    if args.save:
+        from checkpoint import saveCheckpoint
+        saveCheckpoint(sim, args.save)
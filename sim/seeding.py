@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+"""
+Initial particle placement.
+
+All positions are computed up front with NumPy, without asking Box2D about
+overlaps, so the bodies can be created in one batch afterwards. The seeding
+modes are:
+
+    "lattice": a hexagonal lattice with random jitter. Never fails and is the
+               fastest, use it for high area fractions.
+    "poisson": Poisson-disk sampling (Bridson's algorithm), evenly spread
+               positions with no lattice order.
+    "rsa":     random sequential addition, particles are dropped at random
+               spots one after another like the original rejection sampler.
+    "auto":    "rsa", or "lattice" above the area fraction where random
+               addition starts leaving particles out.
+
+"""
+
+import math
+
+import numpy as np
+
+SEEDING_MODES = ("rsa", "poisson", "lattice", "auto")
+RSA_MAX_FRACTION = 0.4 # area fraction up to which "rsa" still places every particle
+
+
+class CellGrid():
+    """Cells of size rmin*sqrt(2), so no cell can hold two particle centers"""
+
+    def __init__(self, box, rmin, rmax, capacity):
+        self.x0 = box[0][0]
+        self.y0 = box[1][0]
+        self.cell = rmin*math.sqrt(2)
+        self.nx = max(1, int(math.ceil((box[0][1] - box[0][0])/self.cell)))
+        self.ny = max(1, int(math.ceil((box[1][1] - box[1][0])/self.cell)))
+        self.rmax = rmax
+
+        self.grid = np.full((self.nx, self.ny), -1, dtype=np.int64)
+        self.pos = np.zeros((capacity, 2))
+        self.rad = np.zeros(capacity)
+        self.n = 0
+
+    def cellOf(self, pts):
+        ix = np.clip(((pts[:, 0] - self.x0)/self.cell).astype(np.int64), 0, self.nx-1)
+        iy = np.clip(((pts[:, 1] - self.y0)/self.cell).astype(np.int64), 0, self.ny-1)
+        return ix, iy
+
+    def fits(self, pts, r):
+        """Which of the candidate centers pts can hold particles of radii r"""
+        r = np.broadcast_to(r, len(pts))
+        if len(pts) == 0:
+            return np.zeros(0, dtype=bool)
+        reach = int(math.ceil((r.max() + self.rmax)/self.cell))
+        offs = np.arange(-reach, reach+1)
+        ix, iy = self.cellOf(pts)
+        ix = np.clip(ix[:, None] + offs, 0, self.nx-1)
+        iy = np.clip(iy[:, None] + offs, 0, self.ny-1)
+        idx = self.grid[ix[:, :, None], iy[:, None, :]].reshape(len(pts), -1)
+
+        taken = idx >= 0
+        near = self.pos[idx] - pts[:, None, :]
+        d2 = near[:, :, 0]**2 + near[:, :, 1]**2
+        return ~np.any(taken & (d2 < (self.rad[idx] + r[:, None])**2), axis=1)
+
+    def insert(self, pts, r):
+        """Add particles, which must not overlap anything already here"""
+        n = len(pts)
+        ix, iy = self.cellOf(pts)
+        self.grid[ix, iy] = np.arange(self.n, self.n + n)
+        self.pos[self.n:self.n + n] = pts
+        self.rad[self.n:self.n + n] = r
+        self.n += n
+
+    def accept(self, pts, r):
+        """Insert the candidates that fit, checking them against each other too
+
+        A candidate that overlaps an earlier fitting candidate of the same
+        batch is turned down. Returns the mask of inserted candidates.
+        """
+        r = np.broadcast_to(r, len(pts))
+        ok = self.fits(pts, r)
+        idx = np.flatnonzero(ok)
+        if len(idx) > 1:
+            d = pts[idx, None, :] - pts[None, idx, :]
+            clash = d[:, :, 0]**2 + d[:, :, 1]**2 < (r[idx, None] + r[None, idx])**2
+            clash = np.tril(clash, -1)
+            ok[idx[clash.any(axis=1)]] = False
+        self.insert(pts[ok], r[ok])
+        return ok
+
+
+def innerBox(box, r):
+    return ((box[0][0] + r, box[0][1] - r), (box[1][0] + r, box[1][1] - r))
+
+def uniform(rng, box, n):
+    return np.column_stack((rng.uniform(*box[0], n), rng.uniform(*box[1], n)))
+
+
+def randomSequential(radii, box, rng, max_tries=200, batch=256):
+    """Drop particles at random free spots, largest first
+
+    Particles are handled in batches which each draw one random spot per
+    particle per try. A particle that can't find a free spot in max_tries
+    tries is left out. Returns the positions of the particles in the order
+    of radii and a mask of the ones that could be placed.
+    """
+    n = len(radii)
+    pos = np.zeros((n, 2))
+    placed = np.zeros(n, dtype=bool)
+    if n == 0:
+        return pos, placed
+
+    grid = CellGrid(box, radii.min(), radii.max(), n)
+    order = np.argsort(-radii, kind="stable")
+    for start in range(0, n, batch):
+        todo = order[start:start + batch]
+        for _ in range(max_tries):
+            r = radii[todo]
+            pts = np.column_stack((rng.uniform(box[0][0] + r, box[0][1] - r),
+                                   rng.uniform(box[1][0] + r, box[1][1] - r)))
+            ok = grid.accept(pts, r)
+            pos[todo[ok]] = pts[ok]
+            placed[todo[ok]] = True
+            todo = todo[~ok]
+            if len(todo) == 0:
+                break
+
+    return pos, placed
+
+
+def poissonDisk(radii, box, rng, k=30, batch=256):
+    """Bridson's Poisson-disk sampling with spacing set by the largest radius
+
+    Up to batch active samples grow at once, each trying k candidates in the
+    annulus around it. Samples are spread until the box is full, then the
+    particles take a random subset of them. Returns positions and a mask of
+    placed particles.
+    """
+    n = len(radii)
+    pos = np.zeros((n, 2))
+    placed = np.zeros(n, dtype=bool)
+    if n == 0:
+        return pos, placed
+
+    rmax = radii.max()
+    inner = innerBox(box, rmax)
+    spacing = 2*rmax
+    # every sample is treated as a particle of radius rmax
+    capacity = int((inner[0][1]-inner[0][0]+spacing)*(inner[1][1]-inner[1][0]+spacing)/spacing**2*1.2) + 1
+    grid = CellGrid(inner, rmax, rmax, capacity)
+
+    grid.insert(uniform(rng, inner, 1), rmax)
+    active = np.array([0])
+    while len(active) and grid.n < capacity:
+        grow = rng.permutation(active)[:min(batch, capacity - grid.n)]
+        m = len(grow)
+
+        # candidates in the annulus between spacing and 2*spacing, tried a
+        # few at a time until each growing sample has found a free one
+        first = np.zeros((m, 2))
+        found = np.zeros(m, dtype=bool)
+        for _ in range(0, k, 6):
+            left = np.flatnonzero(~found)
+            rho = spacing*np.sqrt(rng.uniform(1, 4, (len(left), 6)))
+            theta = rng.uniform(0, 2*np.pi, (len(left), 6))
+            pts = grid.pos[grow[left]][:, None, :] + np.stack((rho*np.cos(theta), rho*np.sin(theta)), axis=2)
+            pts = pts.reshape(-1, 2)
+            ok = ((pts[:, 0] >= inner[0][0]) & (pts[:, 0] <= inner[0][1])
+                  & (pts[:, 1] >= inner[1][0]) & (pts[:, 1] <= inner[1][1]))
+            ok[ok] = grid.fits(pts[ok], rmax)
+            ok = ok.reshape(-1, 6)
+
+            hit = ok.any(axis=1)
+            first[left[hit]] = pts.reshape(-1, 6, 2)[np.flatnonzero(hit), ok[hit].argmax(axis=1)]
+            found[left[hit]] = True
+            if found.all():
+                break
+        first = first[found]
+        start = grid.n
+        grid.accept(first, rmax)
+
+        retired = grow[~found]
+        active = np.concatenate((np.setdiff1d(active, retired), np.arange(start, grid.n)))
+
+    m = min(n, grid.n)
+    chosen = rng.permutation(n)[:m]
+    pos[chosen] = grid.pos[rng.permutation(grid.n)[:m]]
+    placed[chosen] = True
+    return pos, placed
+
+
+def jitteredLattice(radii, box, rng, jitter=1.0):
+    """Hexagonal lattice as wide as the box allows, with random jitter
+
+    The lattice spacing is chosen so the sites just cover the particles. Each
+    particle is moved by up to jitter times half the gap to its neighbours,
+    so they can never overlap. Returns positions and a mask of placed
+    particles.
+    """
+    n = len(radii)
+    pos = np.zeros((n, 2))
+    placed = np.zeros(n, dtype=bool)
+    if n == 0:
+        return pos, placed
+
+    rmax = radii.max()
+    inner = innerBox(box, rmax)
+    w = inner[0][1] - inner[0][0]
+    h = inner[1][1] - inner[1][0]
+
+    def hexSites(a):
+        nx = int(w//a) + 1
+        ny = int(h//(a*math.sqrt(3)/2)) + 1
+        col, row = np.meshgrid(np.arange(nx), np.arange(ny), indexing="xy")
+        sites = np.column_stack(((col + 0.5*(row % 2)).ravel()*a, row.ravel()*a*math.sqrt(3)/2))
+        return sites[(sites[:, 0] <= w) & (sites[:, 1] <= h)]
+
+    # largest spacing with at least n sites, but never less than touching
+    a = max(math.sqrt(w*h*math.sqrt(3)/2/n), 2*rmax)
+    sites = hexSites(a)
+    while len(sites) < n and a > 2*rmax:
+        a = max(a*0.98, 2*rmax)
+        sites = hexSites(a)
+    sites += (inner[0][0], inner[1][0])
+
+    m = min(n, len(sites))
+    sites = sites[rng.permutation(len(sites))[:m]]
+
+    # stay clear of the neighbours and the walls
+    slack = (a - 2*rmax)/2*jitter
+    rho = slack*np.sqrt(rng.random(m))
+    theta = rng.uniform(0, 2*np.pi, m)
+    sites += np.column_stack((rho*np.cos(theta), rho*np.sin(theta)))
+    sites[:, 0] = np.clip(sites[:, 0], *inner[0])
+    sites[:, 1] = np.clip(sites[:, 1], *inner[1])
+
+    chosen = rng.permutation(n)[:m]
+    pos[chosen] = sites
+    placed[chosen] = True
+    return pos, placed
+
+
+def seedPositions(radii, box, rng, mode="rsa"):
+    """Place particles with the given radii inside box using a seeding mode"""
+    radii = np.asarray(radii, dtype=float)
+    if mode == "auto":
+        area = (box[0][1] - box[0][0])*(box[1][1] - box[1][0])
+        mode = "lattice" if np.sum(np.pi*radii**2) > RSA_MAX_FRACTION*area else "rsa"
+    if mode == "rsa":
+        return randomSequential(radii, box, rng)
+    elif mode == "poisson":
+        return poissonDisk(radii, box, rng)
+    elif mode == "lattice":
+        return jitteredLattice(radii, box, rng)
+    raise ValueError("Unknown seeding mode: {}".format(mode))
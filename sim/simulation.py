@@ -0,0 +1,1165 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Headless simulation engine for the 2D DNA nanoparticle self-assembly simulator.
+
+Everything needed to advance the physics lives here and none of it depends on
+pygame, so long annealing runs can be stepped as fast as the CPU allows. The
+pygame window in main.py is just one front-end for a Simulation.
+
+"""
+
+import math, time
+
+import numpy as np
+
+import Box2D  # The main library
+# Box2D.b2 maps Box2D.b2Vec2 to vec2 (and so on)
+from Box2D.b2 import (world, polygonShape, distanceJointDef, staticBody, dynamicBody)
+
+from bonds import BondRegistry
+from clusters import ClusterTracker
+from field import Field
+from profiler import PhaseProfiler
+from seeding import (SEEDING_MODES, seedPositions)
+
+# --- constants ---
+TARGET_FPS = 60 # physics steps per simulated second
+TIME_STEP = 1.0 / TARGET_FPS
+WORLD_WIDTH, WORLD_HEIGHT = 64.0, 36.0 # meters
+
+GROUP_COLORS = ["blue", "purple", "red", "orange"]
+
+# force-dependent bond rupture modes, see Simulation.setRupture
+RUPTURE_MODES = (None, "threshold", "bell")
+
+JOINT_REBUILDS_PER_STEP = 100 # joints recreated per step after a change of joint style, see Simulation.restyleJoints
+
+# freezing of crystal interiors, see Simulation.setFreezing
+FREEZE_CHECK_INTERVAL = 60 # timesteps between looks for particles to freeze
+FREEZE_MIN_STIFFNESS = 10 # Hz, softer spring bonds never freeze
+FREEZE_MIN_CLUSTER = 100 # particles in a cluster before any of them may freeze
+FREEZE_HOLD = 300 # timesteps a particle stays unfrozen after a bond at or next to it broke
+
+# Box2D solver iterations, see Simulation.setSolverIterations
+SOLVER_ITERATIONS = (10, 10) # velocity, position
+MAX_SOLVER_ITERATIONS = 50
+SOLVER_CHECK_INTERVAL = 30 # timesteps between joint error checks
+SOLVER_SAMPLE = 200 # joints measured per check
+SOLVER_GAIN = 0.9 # a raise of the iterations must bring the joint error below this fraction of what it was
+
+FIELD_SAMPLE_INTERVAL = 30 # timesteps between lookups of the local temperature and dissociation rate, see Simulation.setTempField
+MAX_ARRHENIUS_EXPONENT = 50 # rates scaled further than exp(50) are certain to dissociate or bond anyway
+
+
+class ParticleGroup():
+    def __init__(self, radius, mass, color, groupID, interactIDs=[], num=0):
+        self.radius = radius
+        self.mass = mass
+        self.color = color
+        self.groupID = groupID
+        self.interactIDs = interactIDs
+        self.num = num
+
+
+    def can_join(a, b):
+        return b.groupID in a.interactIDs
+
+
+
+class Particle():
+    def __init__(self, group, world, position, velocity=(0,0), angle=0):
+        #position = tuple, velocity = tuple
+        self.group = group
+
+        self.body = world.CreateDynamicBody(position=position, angle=angle)
+        self.body.CreateCircleFixture(radius=group.radius, density=1, friction=0.1, restitution=0.8)
+
+        self.body.linearVelocity = velocity
+        self.body.mass = group.mass
+        self.body.linearDamping = 0.1
+        self.body.angularDamping = 0
+
+        self.body.userData = self
+        self.body.enableSleep = False
+        self.index = -1 # position in Simulation.particles
+
+        self.vmean = 0
+        self.vspread = 1
+
+        self.amean = 0
+        self.aspread = 1
+
+    def setGroup(self, group):
+        """Move the particle to another group, resizing its body in place"""
+        if group.radius != self.group.radius:
+            self.body.fixtures[0].shape.radius = group.radius
+        if group.mass != self.group.mass:
+            self.body.mass = group.mass
+        self.group = group
+
+    def moveTo(self, position):
+        """Teleport the particle, at rest, to a new position"""
+        self.body.transform = (position, 0)
+        self.body.linearVelocity = (0,0)
+        self.body.angularVelocity = 0
+
+    def setRandomVel(self, rng, vmean=None, vspread=None):
+        self.vmean = vmean if vmean is not None else self.vmean
+        self.vspread = vspread if vspread is not None else self.vspread
+
+        v_abs = rng.normal(self.vmean, self.vspread)
+        v_theta = rng.random() * 2*math.pi
+
+        vx = v_abs*math.cos(v_theta)
+        vy = v_abs*math.sin(v_theta)
+        self.body.linearVelocity=(vx,vy)
+
+    def update(self, rng, zeroV=False, amean=6, aspread=0):
+        # apply a random force to the particle, drawn from the simulation's rng
+
+        if zeroV:
+            self.body.linearVelocity=(0,0)
+
+        aspread = amean/10 if aspread == 0 else aspread
+
+        f_abs = 0 if amean == 0 else rng.normal(amean, aspread)
+        f_theta = rng.random() * 2*math.pi
+
+        fx = f_abs*math.cos(f_theta)
+        fy = f_abs*math.sin(f_theta)
+
+        self.body.ApplyForce((fx,fy), point=self.body.worldCenter, wake=True)
+
+
+class particleContactListener(Box2D.b2ContactListener):
+    def __init__(self, sim):
+        Box2D.b2ContactListener.__init__(self)
+        self.sim = sim
+    def BeginContact(self, contact):
+        # particle fixtures carry the particle index, walls carry None
+        a = contact.fixtureA.userData
+        b = contact.fixtureB.userData
+        if a is None or b is None:
+            return
+
+        # queue the pair, bonds are made in bulk after the step
+        sim = self.sim
+        if sim.canBond[sim.groupIndex[a]][sim.groupIndex[b]]:
+            sim.contactQueue.append((a, b))
+
+    # pybox2d calls into Python for every contact whether or not these are
+    # overridden, and the empty overrides are the cheapest way through
+    def EndContact(self, contact):
+        pass
+    def PreSolve(self, contact, oldManifold):
+        pass
+    def PostSolve(self, contact, impulse):
+        pass
+
+class particleQueryCallback(Box2D.b2QueryCallback):
+    # collects the particle index of every fixture Box2D's broadphase reports
+    def __init__(self):
+        Box2D.b2QueryCallback.__init__(self)
+        self.found = []
+    def ReportFixture(self, fixture):
+        i = fixture.userData
+        if i is not None:
+            self.found.append(i)
+        return True
+
+
+class Simulation():
+    """A Box2D world full of particles and the rules that bond them together.
+
+    The simulation has no notion of a display or a clock: step(n) advances the
+    physics by n timesteps of TIME_STEP and run(seconds) by a span of simulated
+    time, as fast as the CPU allows.
+    """
+
+    def __init__(self, width=WORLD_WIDTH, height=WORLD_HEIGHT, seed=None):
+        self.width = width
+        self.height = height
+
+        # --- pybox2d world setup ---
+        self.world = world(gravity=(0, 0), doSleep=True, contactListener=particleContactListener(self))
+
+        # Add borders
+        floor = self.world.CreateStaticBody(
+            position=(0, 0),
+            shapes=polygonShape(box=(width, 1)),
+        )
+        ceiling = self.world.CreateStaticBody(
+            position=(0, height),
+            shapes=polygonShape(box=(width, 1)),
+        )
+        left_wall = self.world.CreateStaticBody(
+            position=(0, 0),
+            shapes=polygonShape(box=(1, height)),
+        )
+        right_wall = self.world.CreateStaticBody(
+            position=(width, 0),
+            shapes=polygonShape(box=(1, height)),
+        )
+
+        self.static_bodies = [floor, left_wall, right_wall, ceiling]
+
+        for sb in self.static_bodies:
+            sb.enableSleep = True
+            sb.isAwake = False
+            for f in sb.fixtures:
+                f.friction = 0.5
+                f.restitution = 0.8
+
+        # region particles are placed in
+        self.box = ((1,width-1),(1,height-1))
+
+        self.groups = []
+        self.particles = []
+        self.bodies = [] # particle bodies, in the same order as particles
+        self.interactions = np.zeros((0, 0), dtype=bool)
+        self.canBond = []
+        self.groupIndex = []
+        self.groupRows = np.zeros(0, dtype=np.int64) # groupIndex as an array
+        self.radii = np.zeros(0)
+        self.frozen = np.zeros(0, dtype=bool) # particle is parked as a static body, see setFreezing
+        self.lastBreak = np.zeros(0, dtype=np.int64)
+        self.activeBodies = [] # bodies that get thermal forces: all but the frozen ones, None when it must be rebuilt
+        self.contactQueue = [] # (particle, particle) pairs touching since the last step
+        self.oldContacts = None # (M, 2) pairs that touched before a checkpoint restore, not new contacts
+        self.bonds = BondRegistry()
+        self.clusters = ClusterTracker() # connected groups of intact bonds
+
+        # every random draw of the run comes from this one stream, so the
+        # seed and the inputs (see replay.py) are enough to repeat a run
+        self.seed = seed if seed is not None else np.random.SeedSequence().entropy
+        self.rng = np.random.default_rng(self.seed)
+        self.inputLog = None # InputLog recording the set* and reset calls
+        self.recorders = [] # objects whose observe(sim) is called after every step
+        self.profiler = PhaseProfiler() # disabled until profiler.enabled is set
+
+        # live parameters, see the set* methods for units
+        self.dissociationRate = 0
+        self.dissociationChance = 0
+        self.jointCooldown = 0
+        self.temp = 20.0
+        self.stiffness = 10.0
+        self.anchorContact = False
+        self.jointsStale = False # some joints may not match anchorContact and jointCollides() yet
+        self.rebuildsPerStep = JOINT_REBUILDS_PER_STEP
+        self.ruptureMode = None
+        self.ruptureForce = 300.0
+        self.forceInterval = 1
+        self.velocityIterations, self.positionIterations = SOLVER_ITERATIONS
+        self.solverFloor = SOLVER_ITERATIONS # iterations the adaptive solver never goes below
+        self.adaptiveSolver = False
+        self.solverTolerance = 0.001
+        self.solverRaise = None # (joint error, iterations) before the last raise, see adaptSolver
+        self.solverStuck = False # a raise didn't help, so no more until the error is low again
+        self.freezing = False
+        self.freezeBonds = 4
+        self.freezeSpeed = 0.5
+        self.tempField = None # Field of temperatures, replaces temp where set
+        self.dissociationField = None # Field of dissociation rates in %/s, replaces dissociationRate where set
+        self.arrhenius = None # (activation, reference temperature), see setArrhenius
+        self.particleTemp = None # local temperature of every particle, None while it is temp everywhere
+        self.particleChance = None # local dissociation chance per timestep of every particle, likewise
+        self.fieldStale = False # the local values must be looked up again before the next step
+        self.associationRules = [] # (groupID, groupID, probability), see setAssociation
+        self.associationActivation = None
+        self.associationReference = 20.0
+        self.association = np.ones((0, 0)) # binding probability of each pair of rows in groups
+        self.associating = False # some contacts may not bond
+
+        self.setDissociationRate(15)
+        self.setCooldown(0.2)
+
+        self.steps = 0
+
+    def logInput(self, method, *args):
+        if self.inputLog is not None:
+            self.inputLog.record(self.steps, method, args)
+
+    def setDissociationRate(self, rate):
+        """Set the bond dissociation rate in % of bonds per second"""
+        self.logInput("setDissociationRate", rate)
+        # convert from rate in dissociation probability per second to chance per timestep
+        if rate != self.dissociationRate:
+            self.fieldStale = True
+        self.dissociationRate = rate
+        self.dissociationChance = 1-math.exp(math.log(1-rate/100)/TARGET_FPS)
+
+    def setCooldown(self, seconds):
+        """Set how long a broken bond waits before the pair may bond again"""
+        self.logInput("setCooldown", seconds)
+        self.jointCooldown = int(seconds*TARGET_FPS)
+
+    def setGravity(self, gx, gy=0):
+        self.logInput("setGravity", gx, gy)
+        self.world.gravity = (gx, gy)
+        if gx or gy:
+            # frozen particles would hang in the air
+            self.thaw(np.flatnonzero(self.frozen))
+
+    def setTemp(self, temp):
+        """Set the mean magnitude of the random force applied to every particle"""
+        self.logInput("setTemp", temp)
+        self.temp = temp
+
+    def setStiffness(self, stiffness):
+        """Set the bond spring frequency in Hz, 0 for rigid bonds"""
+        self.logInput("setStiffness", stiffness)
+        if stiffness == self.stiffness:
+            return
+        collides = self.jointCollides()
+        self.stiffness = stiffness
+
+        # the spring is a live property of the joint
+        for joint in self.bonds.joints:
+            if joint is not None:
+                joint.frequency = stiffness
+        if self.jointCollides() != collides:
+            self.jointsStale = True
+        if 0 < stiffness < FREEZE_MIN_STIFFNESS:
+            self.thaw(np.flatnonzero(self.frozen))
+
+    def setAnchorContact(self, anchorContact):
+        """Anchor bonds at the contact point instead of the particle centers"""
+        self.logInput("setAnchorContact", anchorContact)
+        if anchorContact != self.anchorContact:
+            self.anchorContact = anchorContact
+            self.jointsStale = True
+
+    def setRupture(self, mode, force=None, interval=None):
+        """Let the force on a bond speed up its dissociation
+
+        mode is one of RUPTURE_MODES:
+            None: dissociation is purely statistical (the default)
+            "threshold": bonds pulled harder than force break right away
+            "bell": the dissociation rate grows as exp(F/force), Bell's model
+        Reaction forces are gathered from Box2D every interval steps and
+        only while a mode is set.
+        """
+        self.logInput("setRupture", mode, force, interval)
+        if mode not in RUPTURE_MODES:
+            raise ValueError("Unknown rupture mode: {}".format(mode))
+        self.ruptureMode = mode
+        if force is not None:
+            self.ruptureForce = force
+        if interval is not None:
+            self.forceInterval = max(1, int(interval))
+
+    def setSolverIterations(self, velocity, position, adaptive=False, tolerance=None):
+        """Set the velocity and position iterations of the Box2D solver
+
+        More iterations make rigid bonds hold their length more exactly, at
+        the cost of a slower step. With adaptive set, the given counts are a
+        floor: every SOLVER_CHECK_INTERVAL steps the length error of a sample
+        of rigid bonds is measured, relative to the contact distance of
+        their particles, and the iterations go up while it is above
+        tolerance and back down once it is well below. Spring bonds stretch
+        by design and more iterations don't change that, so with them, or
+        with no bonds at all, the floor is used.
+        """
+        self.logInput("setSolverIterations", velocity, position, adaptive, tolerance)
+        self.solverFloor = (max(1, int(velocity)), max(1, int(position)))
+        self.velocityIterations, self.positionIterations = self.solverFloor
+        self.adaptiveSolver = adaptive
+        self.solverRaise = None
+        self.solverStuck = False
+        if tolerance is not None:
+            self.solverTolerance = tolerance
+
+    def setFreezing(self, enabled, bonds=None, speed=None):
+        """Let particles deep inside crystals freeze until something happens to them
+
+        Every FREEZE_CHECK_INTERVAL steps, particles with at least bonds
+        intact bonds that move slower than speed (m/s), in clusters of at
+        least FREEZE_MIN_CLUSTER particles, are frozen: their
+        bodies become static, so Box2D's solver and the thermal forces skip
+        them and the step cost follows the particles that are still active.
+        A frozen particle thaws when one of its bonds breaks or a particle
+        that can bond with it touches it. Particles don't freeze while there
+        is gravity or the bonds are springs softer than
+        FREEZE_MIN_STIFFNESS. A frozen particle holds its bonded neighbours
+        in place, so a crystal with frozen particles no longer drifts as a
+        whole.
+        """
+        self.logInput("setFreezing", enabled, bonds, speed)
+        self.freezing = enabled
+        if bonds is not None:
+            self.freezeBonds = bonds
+        if speed is not None:
+            self.freezeSpeed = speed
+        if not enabled:
+            self.thaw(np.flatnonzero(self.frozen))
+
+    def setTempField(self, field):
+        """Give the world a temperature that varies across it, None for temp everywhere
+
+        field is a Field (see field.py) of temperature analog values. Every
+        FIELD_SAMPLE_INTERVAL steps each particle looks up the value at its
+        position, and its thermal force is drawn around that value instead
+        of temp until the next lookup.
+        """
+        self.logInput("setTempField", field)
+        self.tempField = field
+        self.fieldStale = True
+
+    def setDissociationField(self, field):
+        """Give the world a dissociation rate that varies across it, None for dissociationRate everywhere
+
+        field is a Field of rates in % of bonds per second, looked up like
+        the temperature field. A bond dissociates with the mean of the
+        chances at its two particles, which is the chance at its middle
+        wherever the field is linear over a particle diameter.
+        """
+        self.logInput("setDissociationField", field)
+        self.dissociationField = field
+        self.fieldStale = True
+
+    def setArrhenius(self, activation, reference=20.0):
+        """Couple the local dissociation rate to the local temperature, None to uncouple
+
+        Where the temperature field has the value T, the dissociation rate
+        (from the dissociation field or dissociationRate) is multiplied by
+        exp(activation*(1/reference - 1/T)), so it is unchanged at the
+        reference temperature, faster above it and slower below. Without a
+        temperature field there is nothing to couple to.
+        """
+        self.logInput("setArrhenius", activation, reference)
+        if reference <= 0:
+            raise ValueError("The Arrhenius reference temperature must be positive, not {}".format(reference))
+        self.arrhenius = None if activation is None else (activation, reference)
+        self.fieldStale = True
+
+    def sampleFields(self):
+        """Look up the local temperature and dissociation chance of every particle"""
+        self.fieldStale = False
+        coupled = self.arrhenius is not None and self.tempField is not None
+        if self.tempField is None and self.dissociationField is None:
+            self.particleTemp = self.particleChance = None
+            return
+
+        pos = self.positions()
+        self.particleTemp = None if self.tempField is None else np.maximum(self.tempField.sample(pos), 0)
+        if self.dissociationField is None and not coupled:
+            self.particleChance = None
+            return
+        if self.dissociationField is None:
+            rate = np.full(len(pos), float(self.dissociationRate))
+        else:
+            rate = self.dissociationField.sample(pos)
+        if coupled:
+            rate = rate*arrheniusFactor(self.particleTemp, *self.arrhenius)
+        self.particleChance = dissociationChances(rate)
+
+    def setAssociation(self, rules, activation=None, reference=20.0):
+        """Let touching particles bond only with some probability, per pair of groups
+
+        rules is a list of (groupID, groupID, probability), in either order.
+        Pairs of groups without a rule bond on every contact. With
+        activation, the probability at temperature T is multiplied by
+        exp(activation*(1/reference - 1/T)), capped at 1, where T is the
+        mean local temperature of the pair (temp without a temperature
+        field). A negative activation makes binding likelier in the cold,
+        like DNA hybridization. All contacts of a step are accepted or
+        rejected together in processContacts, and a rejected pair has to
+        move apart and touch again for another try.
+        """
+        self.logInput("setAssociation", [list(r) for r in rules], activation, reference)
+        if reference <= 0:
+            raise ValueError("The association reference temperature must be positive, not {}".format(reference))
+        self.associationRules = [tuple(r) for r in rules]
+        self.associationActivation = activation
+        self.associationReference = reference
+        self.buildAssociation()
+
+    def clearBonds(self):
+        """Destroy every joint and forget every bond"""
+        for joint in self.bonds.joints:
+            if joint is not None:
+                self.world.DestroyJoint(joint)
+        self.bonds.clear()
+        self.clusters.reset(len(self.particles))
+        self.contactQueue.clear()
+        self.oldContacts = None
+
+    def reset(self, groups, vmean=5, vspread=0.25, seeding="rsa"):
+        """Clear every bond and fill the world with the given groups
+
+        The reset is incremental: particles of a group that already exists
+        (matched by groupID) keep their bodies, resized in place if the
+        radius or mass changed, and only the difference in count is created
+        or destroyed. Positions for every particle are computed up front by
+        one of the SEEDING_MODES, and all velocities are redrawn with mean
+        magnitude vmean. Returns the number of particles of each group that
+        fit, see printPlacement.
+        """
+        self.logInput("reset", groups, vmean, vspread, seeding)
+        self.clearBonds()
+        self.thaw(np.flatnonzero(self.frozen))
+
+        # bodies that can be reused, by group ID. They are switched off while
+        # they move so Box2D doesn't look for contacts after every move.
+        pools = {}
+        for p in self.particles:
+            pools.setdefault(p.group.groupID, []).append(p)
+            p.body.active = False
+
+        self.groups = list(groups)
+        groupOf = [g for g in self.groups for _ in range(g.num)]
+        radii = [g.radius for g in groupOf]
+        positions, placed = seedPositions(radii, self.box, self.rng, seeding)
+
+        particles = []
+        created = 0
+        for g, pos, ok in zip(groupOf, positions.tolist(), placed.tolist()):
+            if not ok:
+                continue
+            pool = pools.get(g.groupID)
+            if pool:
+                p = pool.pop()
+                p.setGroup(g)
+                p.moveTo(pos)
+            else:
+                p = Particle(g, self.world, pos)
+                created += 1
+            particles.append(p)
+
+        destroyed = 0
+        for pool in pools.values():
+            for p in pool:
+                self.world.DestroyBody(p.body)
+                destroyed += 1
+        self.particles = particles
+        for p in particles:
+            p.body.active = True
+
+        placed = [0]*len(self.groups)
+        rows = {id(g): i for i, g in enumerate(self.groups)}
+        for p in particles:
+            placed[rows[id(p.group)]] += 1
+
+        self.profiler.count("bodiesCreated", created)
+        self.profiler.count("bodiesDestroyed", destroyed)
+
+        self.indexParticles()
+        self.setRandomVelocities(vmean, vspread)
+        return placed
+
+    def indexParticles(self):
+        """Number the particles and rebuild the tables that follow their order"""
+        self.bodies = [p.body for p in self.particles]
+        for i, p in enumerate(self.particles):
+            p.index = i
+            p.body.fixtures[0].userData = i
+        self.radii = np.array([p.group.radius for p in self.particles])
+        self.frozen = np.zeros(len(self.particles), dtype=bool)
+        self.lastBreak = np.full(len(self.particles), -FREEZE_HOLD) # step of the last bond break at or next to each particle
+        self.activeBodies = self.bodies
+        self.fieldStale = True
+        self.clusters.reset(len(self.particles))
+
+        self.buildInteractions()
+
+    def setRandomVelocities(self, vmean, vspread):
+        """Give every particle a random velocity, drawn for all of them at once"""
+        n = len(self.bodies)
+        v_abs = self.rng.normal(vmean, vspread, n)
+        v_theta = self.rng.random(n) * 2*np.pi
+        velocities = np.column_stack((v_abs*np.cos(v_theta), v_abs*np.sin(v_theta))).tolist()
+
+        for body, v in zip(self.bodies, velocities):
+            body.linearVelocity = v
+
+    def buildInteractions(self):
+        """Precompute which pairs of groups can bond
+
+        Two groups can bond when either one lists the other in its
+        interactIDs. interactions[i, j] refers to self.groups[i] and
+        self.groups[j], and groupIndex maps each particle to its row.
+        """
+        n = len(self.groups)
+        self.interactions = np.zeros((n, n), dtype=bool)
+        for i, a in enumerate(self.groups):
+            for j, b in enumerate(self.groups):
+                self.interactions[i, j] = ParticleGroup.can_join(a, b) or ParticleGroup.can_join(b, a)
+
+        # plain lists index faster than arrays from inside the contact callback
+        self.canBond = self.interactions.tolist()
+        rows = {id(g): i for i, g in enumerate(self.groups)}
+        self.groupIndex = [rows[id(p.group)] for p in self.particles]
+        self.groupRows = np.array(self.groupIndex, dtype=np.int64)
+        self.buildAssociation()
+
+    def buildAssociation(self):
+        """Fill the binding probability of every pair of groups from the association rules"""
+        n = len(self.groups)
+        self.association = np.ones((n, n))
+        for a, b, probability in self.associationRules:
+            for i, g in enumerate(self.groups):
+                for j, h in enumerate(self.groups):
+                    if (g.groupID, h.groupID) in ((a, b), (b, a)):
+                        self.association[i, j] = probability
+        # certain bonding needs no draw, which keeps such runs identical to runs without rules
+        self.associating = bool((self.association < 1).any()) or self.associationActivation is not None
+
+    def jointCollides(self):
+        """Whether bonded particles keep colliding: always with contact anchors or springs"""
+        return self.anchorContact or self.stiffness > 0
+
+    def makeJoint(self, bondID):
+        """Create the Box2D joint for a bond"""
+        bonds = self.bonds
+        a, b = bonds.members(bondID)
+        bodyA, bodyB = self.bodies[a], self.bodies[b]
+        if self.anchorContact:
+            point = tuple(bonds.point[bondID])
+            anchors = (point, point)
+        else:
+            anchors = (bodyA.worldCenter, bodyB.worldCenter)
+
+        # filling a joint def directly is several times faster than CreateDistanceJoint's keywords
+        jointDef = distanceJointDef()
+        jointDef.Initialize(bodyA, bodyB, *anchors)
+        jointDef.frequencyHz = self.stiffness # 0 makes the joint rigid
+        jointDef.dampingRatio = 1
+        jointDef.collideConnected = self.jointCollides()
+
+        bonds.joints[bondID] = self.world.CreateJoint(jointDef)
+        bonds.contactAnchor[bondID] = self.anchorContact
+        bonds.collide[bondID] = jointDef.collideConnected
+
+    def restyleJoints(self):
+        """Rebuild a batch of the joints that don't match the current settings
+
+        Anchors and the collision flag are fixed when a Box2D joint is
+        created, so after setAnchorContact or a switch between rigid and
+        spring bonds the affected joints must be recreated. Doing all of
+        them at once would stall a step with many bonds, so up to
+        rebuildsPerStep are done per step until every joint matches. Joints
+        moving to contact anchors are anchored where their particles touch
+        now, not where they first touched.
+        """
+        bonds = self.bonds
+        mismatch = (bonds.contactAnchor != self.anchorContact) | (bonds.collide != self.jointCollides())
+        stale = bonds.ids(mismatch & ~bonds.broken & ~bonds.newbond)
+        batch = stale[:self.rebuildsPerStep]
+        if self.anchorContact and len(batch):
+            bonds.point[batch] = self.contactPoints(bonds.pA[batch], bonds.pB[batch])
+        for bondID in batch:
+            self.world.DestroyJoint(bonds.joints[bondID])
+            self.makeJoint(bondID)
+        self.jointsStale = len(stale) > len(batch)
+        self.profiler.count("jointsRebuilt", len(batch))
+
+    def breakBond(self, bondID):
+        """Destroy a bond's joint and start its cooldown"""
+        bonds = self.bonds
+        joint = bonds.joints[bondID]
+        if joint is not None:
+            self.world.DestroyJoint(joint)
+            bonds.joints[bondID] = None
+        bonds.broken[bondID] = True
+        bonds.cooldown[bondID] = self.jointCooldown
+        a, b = bonds.members(bondID)
+        self.clusters.removeBond(a, b)
+        if self.freezing:
+            neighbours = self.clusters.neighbours
+            around = np.array([a, b, *neighbours[a], *neighbours[b]])
+            self.lastBreak[around] = self.steps
+            self.thaw(around)
+
+        for i in bonds.members(bondID):
+            self.particles[i].update(self.rng, zeroV=True)
+
+    def buildPendingJoints(self):
+        """Create the joints of every bond that is waiting for one"""
+        bonds = self.bonds
+        for bondID in bonds.ids(bonds.newbond):
+            self.makeJoint(bondID)
+        bonds.newbond[:] = False
+
+    def processContacts(self):
+        """Turn the contacts queued during the last step into bonds
+
+        The queued pairs are deduplicated and checked against the existing
+        bonds (including the ones still cooling down) in one go, then the
+        new bonds are registered. Their joints are built afterwards by
+        buildPendingJoints.
+        """
+        queue = self.contactQueue
+        if not queue:
+            return
+        self.profiler.count("contactsQueued", len(queue))
+
+        pairs = np.array(queue, dtype=np.int32)
+        queue.clear()
+        pairs.sort(axis=1)
+        pairs = np.unique(pairs, axis=0)
+        pairs = pairs[~self.bonds.contains(pairs[:, 0], pairs[:, 1])]
+        if self.oldContacts is not None and len(pairs):
+            # Box2D reports these again after a restore, having lost its contact cache
+            n = len(self.particles)
+            old = np.isin(pairs[:, 0].astype(np.int64)*n + pairs[:, 1], self.oldContacts[:, 0].astype(np.int64)*n + self.oldContacts[:, 1])
+            pairs = pairs[~old]
+        if self.associating and len(pairs):
+            accepted = self.acceptContacts(pairs[:, 0], pairs[:, 1])
+            self.profiler.count("contactsRejected", len(pairs) - int(accepted.sum()))
+            pairs = pairs[accepted]
+        if len(pairs) == 0:
+            return
+
+        self.thaw(pairs.ravel())
+        points = self.contactPoints(pairs[:, 0], pairs[:, 1])
+        for (a, b), point in zip(pairs.tolist(), points.tolist()):
+            self.bonds.add(a, b, point)
+            self.clusters.addBond(a, b)
+        self.profiler.count("bondsMade", len(pairs))
+
+    def acceptContacts(self, a, b):
+        """One draw for the new contacts of particles a[k] and b[k], True where they bond, see setAssociation"""
+        rows = self.groupRows
+        probability = self.association[rows[a], rows[b]]
+        if self.associationActivation is not None:
+            temp = self.temp if self.particleTemp is None else (self.particleTemp[a] + self.particleTemp[b])/2
+            scale = arrheniusFactor(temp, self.associationActivation, self.associationReference)
+            probability = np.minimum(probability*scale, 1)
+        return self.rng.random(len(a)) < probability
+
+    def touchingPairs(self):
+        """(M, 2) sorted particle pairs that Box2D has in touching contact right now"""
+        pairs = [(c.fixtureA.userData, c.fixtureB.userData) for c in self.world.contacts if c.touching]
+        pairs = np.array([p for p in pairs if None not in p], dtype=np.int32).reshape(-1, 2)
+        pairs.sort(axis=1)
+        return pairs
+
+    def contactPoints(self, a, b):
+        """(M, 2) points where the circles of particles a[k] and b[k] touch, on the line between their centers"""
+        posA = self.positions(a.tolist())
+        posB = self.positions(b.tolist())
+        d = posB - posA
+        dist = np.maximum(np.hypot(d[:, 0], d[:, 1]), 1e-9)
+        return posA + d*(self.radii[a]/dist)[:, None]
+
+    def updateBonds(self):
+        """Let bonds dissociate and cool down"""
+        bonds = self.bonds
+
+        if self.jointsStale:
+            self.restyleJoints()
+
+        # count down the broken bonds and forget the ones that are done
+        cooling = bonds.alive & bonds.broken
+        bonds.cooldown[cooling] -= 1
+        done = np.flatnonzero(cooling & (bonds.cooldown <= 0))
+        if self.freezing and len(done):
+            self.requeueTouching(bonds.pA[done], bonds.pB[done])
+        for bondID in done:
+            bonds.remove(bondID)
+
+        # one draw for every intact bond, only the breaking ones touch Box2D
+        intact = bonds.ids(~bonds.broken)
+        r = self.rng.random(len(intact))
+        if self.particleChance is None:
+            chance = self.dissociationChance
+        else:
+            chance = (self.particleChance[bonds.pA[intact]] + self.particleChance[bonds.pB[intact]])/2
+        if self.ruptureMode is None:
+            breaking = r < chance
+        else:
+            if self.steps % self.forceInterval == 0:
+                self.measureBondForces(intact)
+            breaking = r < self.ruptureChance(bonds.force[intact], chance)
+
+        for bondID in intact[breaking]:
+            self.breakBond(bondID)
+        self.profiler.count("bondsBroken", int(breaking.sum()))
+
+    def measureBondForces(self, bondIDs):
+        """Read the reaction force of the given bonds' joints into the registry"""
+        joints = self.bonds.joints
+        self.bonds.force[bondIDs] = [joints[i].GetReactionForce(TARGET_FPS).length for i in bondIDs]
+
+    def ruptureChance(self, force, chance):
+        """Per-step dissociation chance of bonds under the given forces, from their chance without force"""
+        if self.ruptureMode == "threshold":
+            return np.where(force > self.ruptureForce, 1.0, chance)
+
+        # Bell: scale the rate, then convert back to a chance per timestep
+        scale = np.exp(np.minimum(force/self.ruptureForce, 50))
+        return 1 - (1 - chance)**scale
+
+    def jointError(self):
+        """Mean length error of up to SOLVER_SAMPLE rigid bonds, relative to their contact distance
+
+        None while there are no rigid bonds to measure. Bonds anchored at the
+        contact point are left out: their joints have no length and push
+        against the collision of their particles, a gap no number of
+        iterations closes.
+        """
+        bonds = self.bonds
+        intact = bonds.ids(~bonds.broken & ~bonds.newbond & ~bonds.contactAnchor)
+        if self.stiffness > 0 or len(intact) == 0:
+            return None
+        sample = intact[::max(1, len(intact)//SOLVER_SAMPLE)]
+        joints = [bonds.joints[i] for i in sample]
+        ends = np.array([(j.anchorA.tuple, j.anchorB.tuple) for j in joints])
+        length = np.array([j.length for j in joints])
+        stretch = np.hypot(*(ends[:, 0] - ends[:, 1]).T) - length
+        return float(np.mean(np.abs(stretch)/(self.radii[bonds.pA[sample]] + self.radii[bonds.pB[sample]])))
+
+    def adaptSolver(self):
+        """Raise or lower the solver iterations by the measured joint error
+
+        Iterations only go on rising while each raise cuts the error. A raise
+        that doesn't is undone, and there are no more raises until the
+        error has been low again.
+        """
+        error = self.jointError()
+        v, p = self.velocityIterations, self.positionIterations
+        raised, self.solverRaise = self.solverRaise, None
+        if error is None or error < self.solverTolerance/4:
+            v, p = max(self.solverFloor[0], v - 1), max(self.solverFloor[1], p - 1)
+            self.solverStuck = False
+        elif error > self.solverTolerance:
+            if raised is not None and error > raised[0]*SOLVER_GAIN:
+                v, p = raised[1]
+                self.solverStuck = True
+            elif not self.solverStuck and (v, p) != (MAX_SOLVER_ITERATIONS, MAX_SOLVER_ITERATIONS):
+                self.solverRaise = (error, (v, p))
+                v, p = min(MAX_SOLVER_ITERATIONS, v + v//2 + 1), min(MAX_SOLVER_ITERATIONS, p + p//2 + 1)
+        self.velocityIterations, self.positionIterations = v, p
+
+    def freeze(self, indices):
+        """Park the given particles as static bodies"""
+        if len(indices) == 0:
+            return
+        bodies = self.bodies
+        for i in indices.tolist():
+            bodies[i].type = staticBody
+        self.frozen[indices] = True
+        self.activeBodies = None
+        self.profiler.count("particlesFrozen", len(indices))
+
+    def thaw(self, indices):
+        """Make the given frozen particles dynamic again, at rest"""
+        indices = indices[self.frozen[indices]]
+        if len(indices) == 0:
+            return
+        for i in indices.tolist():
+            body = self.bodies[i]
+            body.type = dynamicBody
+            # Box2D recomputes the mass from the density
+            body.mass = self.particles[i].group.mass
+        self.frozen[indices] = False
+        self.activeBodies = None
+        self.profiler.count("particlesThawed", len(indices))
+
+    def freezeInterior(self):
+        """Freeze the slow, well bonded particles, see setFreezing"""
+        if self.world.gravity.lengthSquared > 0 or 0 < self.stiffness < FREEZE_MIN_STIFFNESS:
+            return
+        bonds = self.bonds
+        intact = bonds.ids(~bonds.broken)
+        n = len(self.particles)
+        count = np.bincount(bonds.pA[intact], minlength=n) + np.bincount(bonds.pB[intact], minlength=n)
+        # particles around a broken bond need time to move apart and touch again
+        settled = self.lastBreak < self.steps - FREEZE_HOLD
+        candidates = np.flatnonzero(~self.frozen & settled & (count >= self.freezeBonds))
+        # small clusters still drift and merge
+        clusters = self.clusters
+        candidates = candidates[[len(clusters.clusterOf(i)) >= FREEZE_MIN_CLUSTER for i in candidates.tolist()]]
+        if len(candidates) == 0:
+            return
+        v = self.velocities(candidates.tolist())
+        self.freeze(candidates[np.hypot(v[:, 0], v[:, 1]) < self.freezeSpeed])
+
+    def requeueTouching(self, a, b):
+        """Queue the pairs a[k], b[k] that still touch for bonding
+
+        A new bond needs a new contact, which two touching particles only
+        make after moving apart and back. Next to frozen particles they
+        can't, so while freezing is on, pairs whose cooldown ends while
+        they touch are queued as if they had just touched again.
+        """
+        d = self.positions(a.tolist()) - self.positions(b.tolist())
+        touching = np.hypot(d[:, 0], d[:, 1]) < (self.radii[a] + self.radii[b])*1.01
+        self.contactQueue.extend(zip(a[touching].tolist(), b[touching].tolist()))
+
+    def applyThermalForces(self):
+        """Apply a random force to every particle that isn't frozen, drawn for all of them at once"""
+        if self.activeBodies is None:
+            self.activeBodies = [b for b, f in zip(self.bodies, self.frozen.tolist()) if not f]
+        bodies = self.activeBodies
+        n = len(bodies)
+        if self.particleTemp is None:
+            temp = max(self.temp, 0) # like the field, a negative temperature means none
+            if temp == 0:
+                return
+        else:
+            temp = self.particleTemp if n == len(self.bodies) else self.particleTemp[~self.frozen]
+        if n == 0:
+            return
+
+        f_abs = self.rng.normal(temp, temp/10, n)
+        f_theta = self.rng.random(n) * 2*np.pi
+        forces = np.column_stack((f_abs*np.cos(f_theta), f_abs*np.sin(f_theta))).tolist()
+
+        for body, f in zip(bodies, forces):
+            body.ApplyForceToCenter(f, True)
+
+    def step(self, n=1):
+        """Advance the simulation by n timesteps"""
+        profiler = self.profiler
+        for _ in range(n):
+            profiler.begin()
+            if self.fieldStale or (self.tempField is not None or self.dissociationField is not None) and self.steps % FIELD_SAMPLE_INTERVAL == 0:
+                self.sampleFields()
+            self.updateBonds()
+            profiler.lap("bonds")
+            self.applyThermalForces()
+            profiler.lap("thermal")
+
+            # Make Box2D simulate the physics of our world for one step.
+            self.world.Step(TIME_STEP, self.velocityIterations, self.positionIterations)
+            profiler.lap("physics")
+            self.processContacts()
+            self.oldContacts = None
+            profiler.lap("contacts")
+            self.buildPendingJoints()
+            if self.adaptiveSolver and self.steps % SOLVER_CHECK_INTERVAL == 0:
+                self.adaptSolver()
+            if self.freezing and self.steps % FREEZE_CHECK_INTERVAL == 0:
+                self.freezeInterior()
+            profiler.lap("joints")
+            self.steps += 1
+            for r in self.recorders:
+                r.observe(self)
+            profiler.lap("recorders")
+
+    def stepFor(self, seconds, maxSteps=None):
+        """Step for about the given span of wall-clock time and return the number of steps taken
+
+        At least one step is always taken. This is what fast-forward uses to
+        spend the time between two displayed frames on physics.
+        """
+        deadline = time.perf_counter() + seconds
+        n = 0
+        while n == 0 or time.perf_counter() < deadline:
+            if maxSteps is not None and n >= maxSteps:
+                break
+            self.step()
+            n += 1
+        return n
+
+    def run(self, seconds):
+        """Advance the simulation by the given span of simulated time"""
+        self.step(int(round(seconds*TARGET_FPS)))
+
+    def positions(self, indices=None):
+        """(N, 2) array of every particle's position, in particle order, or of the given particles only"""
+        bodies = self.bodies if indices is None else [self.bodies[i] for i in indices]
+        if not bodies:
+            return np.zeros((0, 2))
+        return np.array([b.worldCenter.tuple for b in bodies])
+
+    def query(self, box):
+        """Indices of the particles that may overlap box, ((xmin, xmax), (ymin, ymax))
+
+        The lookup goes through Box2D's broadphase tree, so its cost follows
+        the number of particles found rather than the number in the world.
+        A few particles just outside the box can be included.
+        """
+        (xmin, xmax), (ymin, ymax) = box
+        callback = particleQueryCallback()
+        self.world.QueryAABB(callback, Box2D.b2AABB(lowerBound=(xmin, ymin), upperBound=(xmax, ymax)))
+        return np.array(callback.found, dtype=np.int64)
+
+    def velocities(self, indices=None):
+        """(N, 2) array of every particle's velocity, in particle order, or of the given particles only"""
+        bodies = self.bodies if indices is None else [self.bodies[i] for i in indices]
+        if not bodies:
+            return np.zeros((0, 2))
+        return np.array([b.linearVelocity.tuple for b in bodies])
+
+    def time(self):
+        """Simulated time in seconds"""
+        return self.steps*TIME_STEP
+
+
+
+def dissociationChances(rate):
+    """Chance per timestep of dissociation rates in % of bonds per second, rates of 100 or more always dissociate"""
+    return 1 - (1 - np.clip(rate, 0, 100)/100)**(1/TARGET_FPS)
+
+def arrheniusFactor(temp, activation, reference):
+    """exp(activation*(1/reference - 1/temp)), with the exponent capped at MAX_ARRHENIUS_EXPONENT so it never overflows"""
+    temp = np.maximum(temp, 1e-9)
+    return np.exp(np.minimum(activation*(1/reference - 1/temp), MAX_ARRHENIUS_EXPONENT))
+
+def parseField(text, width, height):
+    """Parse a field definition: a .npy file of grid values, 'x:start:end' or 'y:start:end'
+    for a linear gradient, or 'radial:center:edge'"""
+    if text.endswith(".npy"):
+        return Field(np.load(text), width, height)
+    kind, a, b = text.split(":")
+    if kind == "radial":
+        return Field.radial(width, height, float(a), float(b))
+    if kind in ("x", "y"):
+        return Field.linear(width, height, float(a), float(b), axis=kind)
+    raise ValueError("Unknown field: {}".format(text))
+
+def printPlacement(groups, placed):
+    """Report the particle counts returned by Simulation.reset"""
+    for g, n in zip(groups, placed):
+        if n < g.num:
+            print("Overlapping! Only {0} of {1} group {2} particles fit".format(n, g.num, g.groupID))
+        else:
+            print("{0} group {1} particles created".format(n, g.groupID))
+
+def parseGroup(text, groupID):
+    """Parse a 'radius:mass:interactions:count' group definition"""
+    radius, mass, interactions, num = text.split(":")
+    interactIDs = [int(c) for c in interactions.split(",") if c]
+    color = GROUP_COLORS[groupID % len(GROUP_COLORS)]
+    return ParticleGroup(float(radius), float(mass), color, groupID, interactIDs, int(num))
+
+def groupToDict(group):
+    """JSON friendly form of a ParticleGroup"""
+    # colors are names or pygame.Color objects
+    color = group.color if isinstance(group.color, str) else list(group.color)
+    return {"radius": group.radius, "mass": group.mass, "color": color,
+            "groupID": group.groupID, "interactIDs": list(group.interactIDs), "num": group.num}
+
+def groupFromDict(d):
+    color = d["color"] if isinstance(d["color"], str) else tuple(d["color"])
+    return ParticleGroup(d["radius"], d["mass"], color, d["groupID"], d["interactIDs"], d["num"])
+
+
+if __name__ == "__main__":
+    import argparse, time
+
+    parser = argparse.ArgumentParser(description="Run the self-assembly simulation without a display")
+    parser.add_argument("--group", action="append", default=[],
+                        help="group definition radius:mass:interactions:count, e.g. 0.4:1:1:500 (repeatable)")
+    parser.add_argument("--seconds", type=float, default=60, help="simulated time to run")
+    parser.add_argument("--dissoc-rate", type=float, default=15, help="bond dissociation rate (%%/s)")
+    parser.add_argument("--cooldown", type=float, default=0.2, help="bond cooldown (s)")
+    parser.add_argument("--stiffness", type=float, default=10, help="bond stiffness (Hz, 0=rigid)")
+    parser.add_argument("--gravity", type=float, default=0, help="gravity (+x direction)")
+    parser.add_argument("--temp", type=float, default=20, help="temperature analog")
+    parser.add_argument("--temp-field", default=None,
+                        help="temperature varying across the world: a .npy grid, x:START:END, y:START:END or radial:CENTER:EDGE")
+    parser.add_argument("--dissoc-field", default=None, help="dissociation rate (%%/s) varying across the world, like --temp-field")
+    parser.add_argument("--arrhenius", type=float, default=None, metavar="ACTIVATION",
+                        help="scale the local dissociation rate by exp(ACTIVATION*(1/--arrhenius-reference - 1/T)) of the local temperature T")
+    parser.add_argument("--arrhenius-reference", type=float, default=20, help="temperature at which --arrhenius leaves the rate unchanged")
+    parser.add_argument("--association", action="append", default=[], metavar="A:B:P",
+                        help="contacts between groups A and B bond with probability P instead of always (repeatable)")
+    parser.add_argument("--association-activation", type=float, default=None,
+                        help="scale the association probabilities by exp(ACTIVATION*(1/--association-reference - 1/T)) of the local temperature T")
+    parser.add_argument("--association-reference", type=float, default=20, help="temperature at which the association probabilities apply unchanged")
+    parser.add_argument("--world", type=float, nargs=2, default=[WORLD_WIDTH, WORLD_HEIGHT], metavar=("WIDTH", "HEIGHT"),
+                        help="world size in meters")
+    parser.add_argument("--seed", type=int, default=None, help="seed of the random numbers (default: a fresh one)")
+    parser.add_argument("--log", default=None, help="record the seed and parameter changes to this file for replay.py")
+    parser.add_argument("--seeding", choices=SEEDING_MODES, default="rsa", help="initial particle placement")
+    parser.add_argument("--rupture", choices=[m for m in RUPTURE_MODES if m], default=None,
+                        help="force-dependent bond rupture mode")
+    parser.add_argument("--rupture-force", type=float, default=300, help="rupture force scale (N)")
+    parser.add_argument("--force-interval", type=int, default=1, help="timesteps between bond force readings")
+    parser.add_argument("--solver-iterations", type=int, nargs=2, default=list(SOLVER_ITERATIONS), metavar=("VELOCITY", "POSITION"),
+                        help="Box2D solver iterations per step")
+    parser.add_argument("--adaptive-solver", action="store_true",
+                        help="raise the solver iterations above --solver-iterations while rigid bonds stretch")
+    parser.add_argument("--freeze", action="store_true", help="let slow, well bonded particles inside crystals freeze")
+    parser.add_argument("--freeze-bonds", type=int, default=4, help="bonds a particle needs to freeze")
+    parser.add_argument("--freeze-speed", type=float, default=0.5, help="speed (m/s) a particle must be below to freeze")
+    parser.add_argument("--print-interval", type=float, default=5, help="simulated seconds between reports")
+    parser.add_argument("--restore", default=None, help="continue from this checkpoint, with its saved parameters, instead of seeding")
+    parser.add_argument("--checkpoint", default=None, help="write checkpoints to this file")
+    parser.add_argument("--checkpoint-interval", type=float, default=300, help="wall-clock seconds between checkpoints")
+    parser.add_argument("--profile", action="store_true", help="time every phase of a step and print it with the reports")
+    parser.add_argument("--profile-out", default=None, help="write the timings to this .csv or .json file at the end")
+    parser.add_argument("--structure", action="store_true", help="add psi6 and coordination numbers to the reports")
+    parser.add_argument("--trajectory", default=None, help="record a trajectory to this directory")
+    parser.add_argument("--trajectory-interval", type=int, default=60, help="timesteps between trajectory frames")
+    parser.add_argument("--trajectory-velocities", action="store_true", help="record velocities too")
+    parser.add_argument("--trajectory-bonds", action="store_true", help="record the bond list of every frame")
+    args = parser.parse_args()
+
+    groupArgs = args.group if args.group else ["0.4:1:1:500", "0.25:1:0:500"]
+
+    sim = Simulation(*args.world, seed=args.seed)
+    print("Seed: {}".format(sim.seed))
+    if args.log:
+        from replay import InputLog
+        inputLog = InputLog(sim)
+    sim.setDissociationRate(args.dissoc_rate)
+    sim.setCooldown(args.cooldown)
+    sim.setStiffness(args.stiffness)
+    sim.setGravity(args.gravity)
+    sim.setTemp(args.temp)
+    sim.setRupture(args.rupture, args.rupture_force, args.force_interval)
+    sim.setSolverIterations(*args.solver_iterations, adaptive=args.adaptive_solver)
+    sim.setFreezing(args.freeze, args.freeze_bonds, args.freeze_speed)
+    if args.temp_field:
+        sim.setTempField(parseField(args.temp_field, sim.width, sim.height))
+    if args.dissoc_field:
+        sim.setDissociationField(parseField(args.dissoc_field, sim.width, sim.height))
+    if args.arrhenius is not None:
+        sim.setArrhenius(args.arrhenius, args.arrhenius_reference)
+    if args.association or args.association_activation is not None:
+        rules = [(int(a), int(b), float(p)) for a, b, p in (r.split(":") for r in args.association)]
+        sim.setAssociation(rules, args.association_activation, args.association_reference)
+    if args.restore:
+        from checkpoint import restoreCheckpoint
+        restoreCheckpoint(sim, args.restore)
+        print("Restored {0} at t={1:.1f}s".format(args.restore, sim.time()))
+    else:
+        groups = [parseGroup(g, i) for i, g in enumerate(groupArgs)]
+        printPlacement(groups, sim.reset(groups, seeding=args.seeding))
+    if args.checkpoint:
+        from checkpoint import saveCheckpoint
+    if args.structure:
+        from analysis import simulationStructure
+    if args.trajectory:
+        from trajectory import TrajectoryWriter
+        writer = TrajectoryWriter(args.trajectory, args.trajectory_interval,
+                                  args.trajectory_velocities, args.trajectory_bonds)
+        writer.record(sim)
+        sim.recorders.append(writer)
+
+    sim.profiler.enabled = args.profile or bool(args.profile_out)
+
+    firstStep = sim.steps
+    totalSteps = firstStep + int(round(args.seconds*TARGET_FPS))
+    printSteps = max(1, int(round(args.print_interval*TARGET_FPS)))
+    start = lastSave = time.perf_counter()
+    while sim.steps < totalSteps:
+        n = min(printSteps, totalSteps - sim.steps)
+        sim.step(n)
+        sim.profiler.endSample(n)
+        now = time.perf_counter()
+        print("t={0:.1f}s: There are {1} bonds, {2} clusters, largest {3:.1%} ({4:.0f} steps/s)".format(
+            sim.time(), len(sim.bonds), sim.clusters.count(), sim.clusters.largestFraction(), (sim.steps - firstStep)/(now - start)))
+        if args.freeze:
+            print("    {0} of {1} particles frozen".format(int(sim.frozen.sum()), len(sim.particles)))
+        if args.structure:
+            order = simulationStructure(sim)
+            print("    psi6={0:.3f} local psi6={1:.3f} psi4={2:.3f} coordination={3:.2f} sixfold={4:.1%}".format(
+                order["psi6"], order["localPsi6"], order["psi4"], order["coordination"], order["sixfold"]))
+        if args.profile:
+            for line in sim.profiler.lines():
+                print("    " + line)
+        if args.checkpoint and (now - lastSave >= args.checkpoint_interval or sim.steps >= totalSteps):
+            saveCheckpoint(sim, args.checkpoint)
+            lastSave = now
+    if args.trajectory:
+        writer.close()
+    if args.profile_out:
+        sim.profiler.write(args.profile_out)
+    if args.log:
+        inputLog.save(args.log)
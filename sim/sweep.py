@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Parameter sweeps over headless simulations.
+
+A sweep is described by a JSON file with default parameters and either a
+grid, whose value lists are combined into every possible point, or an
+explicit list of points:
+
+    {
+        "base": {"seconds": 120, "groups": ["0.4:1:1:500", "0.25:1:0:500"]},
+        "grid": {"dissocRate": [5, 15, 30], "temp": [10, 20]}
+    }
+
+Each point runs as an independent simulation in a pool of worker processes
+and adds one row of summary metrics to a CSV table. The time series of bond
+counts go to a second, long format CSV next to it. Rows are written as the
+runs finish, so an interrupted sweep picks up where it stopped when it is
+started again with the same output file. Runs that failed or timed out are
+run again and their new rows are appended after the old ones.
+
+Every run is seeded. A point without a "seed" gets one made from its
+parameters, so running it again repeats it exactly, and the seed used goes
+into its row. Sweep over "seed" to repeat a point with different random
+numbers.
+
+A run that passes the timeout stops after its current step. A worker
+that crashes or hangs past the timeout is recorded as failed and doesn't
+hold up the rest of the sweep.
+
+Usage: python sweep.py spec.json --out results.csv [--workers N] [--timeout S]
+
+"""
+
+import csv, hashlib, itertools, json, os, queue, time
+import multiprocessing
+
+import numpy as np
+
+from simulation import (Simulation, parseGroup, TARGET_FPS)
+from analysis import simulationStructure
+
+# parameters of a run and their default values
+DEFAULTS = {
+    "seconds": 60,
+    "dissocRate": 15,
+    "cooldown": 0.2,
+    "stiffness": 10,
+    "gravity": 0,
+    "temp": 20,
+    "seeding": "rsa",
+    "groups": ["0.4:1:1:500", "0.25:1:0:500"],
+    "sampleInterval": 1, # simulated seconds between bond count samples
+    "seed": None, # None for a seed made from the other parameters
+}
+
+KILL_GRACE = 60 # seconds past the timeout before a run that doesn't stop on its own is killed
+
+METRICS = ["status", "wallTime", "stepsPerSecond", "particles", "finalBonds", "meanBonds", "maxBonds", "bondsPerParticle",
+           "clusters", "largestClusterFraction", "psi6", "localPsi6", "psi4", "coordination"]
+
+
+def expandSpec(spec):
+    """List every point of a sweep spec as a full parameter dict"""
+    base = dict(DEFAULTS)
+    base.update(spec.get("base", {}))
+
+    points = []
+    if "grid" in spec:
+        keys = list(spec["grid"])
+        for values in itertools.product(*(spec["grid"][k] for k in keys)):
+            points.append(dict(zip(keys, values)))
+    points.extend(spec.get("points", []))
+    if not points:
+        points = [{}]
+
+    runs = []
+    for p in points:
+        unknown = set(p) - set(DEFAULTS)
+        if unknown:
+            raise ValueError("Unknown sweep parameters: {}".format(", ".join(sorted(unknown))))
+        params = dict(base)
+        params.update(p)
+        runs.append(params)
+    return runs
+
+def runID(params):
+    """Short stable ID of a parameter set, used to resume a sweep"""
+    text = json.dumps(params, sort_keys=True)
+    return hashlib.sha1(text.encode()).hexdigest()[:12]
+
+def runSeed(rid, params):
+    """The seed of a run: its seed parameter, or one made from its ID"""
+    return params["seed"] if params["seed"] is not None else int(rid, 16)
+
+
+def buildSimulation(params, seed=None):
+    sim = Simulation(seed=seed)
+    sim.setDissociationRate(params["dissocRate"])
+    sim.setCooldown(params["cooldown"])
+    sim.setStiffness(params["stiffness"])
+    sim.setGravity(params["gravity"])
+    sim.setTemp(params["temp"])
+    sim.reset([parseGroup(g, i) for i, g in enumerate(params["groups"])], seeding=params["seeding"])
+    return sim
+
+def summarize(sim, series):
+    """Summary metrics of a finished run"""
+    bonds = np.array([b for _, b in series]) if series else np.zeros(1)
+    n = len(sim.particles)
+    order = simulationStructure(sim)
+    return {
+        "particles": n,
+        "finalBonds": int(bonds[-1]),
+        "meanBonds": float(bonds.mean()),
+        "maxBonds": int(bonds.max()),
+        "bondsPerParticle": 2*float(bonds[-1])/n if n else 0.0,
+        "clusters": sim.clusters.count(),
+        "largestClusterFraction": sim.clusters.largestFraction(),
+        "psi6": order["psi6"],
+        "localPsi6": order["localPsi6"],
+        "psi4": order["psi4"],
+        "coordination": order["coordination"],
+    }
+
+def runPoint(job):
+    """Run one sweep point in a worker process and return its results"""
+    rid, params, timeout = job
+    start = time.perf_counter()
+    series = []
+    status = "ok"
+    steps = 0
+    seed = runSeed(rid, params)
+    try:
+        sim = buildSimulation(params, seed)
+        totalSteps = int(round(params["seconds"]*TARGET_FPS))
+        sampleSteps = max(1, int(round(params["sampleInterval"]*TARGET_FPS)))
+
+        series.append((0.0, len(sim.bonds)))
+        while sim.steps < totalSteps:
+            sim.step()
+            steps = sim.steps
+            late = timeout and time.perf_counter() - start > timeout
+            if steps % sampleSteps == 0 or steps == totalSteps or late:
+                series.append((sim.time(), len(sim.bonds)))
+            if late:
+                status = "timeout"
+                break
+        metrics = summarize(sim, series)
+    except Exception as e:
+        status = "error: {}".format(e)
+        metrics = {}
+
+    wallTime = time.perf_counter() - start
+    metrics["seed"] = seed
+    metrics["status"] = status
+    metrics["wallTime"] = wallTime
+    metrics["stepsPerSecond"] = steps/wallTime if wallTime > 0 else 0.0
+    return rid, params, metrics, series
+
+
+def runWorker(k, job, results):
+    results.put((k, runPoint(job)))
+
+def runJobs(jobs, workers, timeout=None):
+    """Yield the results of runPoint for every job as they finish, workers at a time
+
+    Every job runs in a fresh process, so every run gets a fresh Box2D
+    world. A process that dies, or is still running KILL_GRACE seconds
+    past the timeout and is killed, yields a result with the reason as its
+    status and no metrics.
+    """
+    results = multiprocessing.Queue()
+    pending = list(enumerate(jobs))
+    running = {} # k -> (process, job, start)
+    while pending or running:
+        while pending and len(running) < workers:
+            k, job = pending.pop(0)
+            process = multiprocessing.Process(target=runWorker, args=(k, job, results), daemon=True)
+            process.start()
+            running[k] = (process, job, time.perf_counter())
+
+        try:
+            k, result = results.get(timeout=1)
+        except queue.Empty:
+            pass
+        else:
+            if k in running:
+                running.pop(k)[0].join()
+                yield result
+            continue
+
+        for k, (process, job, start) in list(running.items()):
+            elapsed = time.perf_counter() - start
+            if timeout and elapsed > timeout + KILL_GRACE:
+                process.kill()
+                status = "killed after timeout"
+            elif process.exitcode not in (None, 0):
+                # a run that finished has put its result before exiting with 0
+                status = "died with exit code {}".format(process.exitcode)
+            else:
+                continue
+            process.join()
+            del running[k]
+            rid, params, _ = job
+            yield rid, params, {"seed": runSeed(rid, params), "status": status, "wallTime": elapsed, "stepsPerSecond": 0.0}, []
+
+
+def finishedRuns(path):
+    """IDs of the runs that already finished successfully in a results table"""
+    if not os.path.exists(path):
+        return set()
+    with open(path, newline="") as f:
+        return {row["runID"] for row in csv.DictReader(f) if row.get("status") == "ok"}
+
+def availableCPUs():
+    """CPUs this process may run on, which can be fewer than the machine has"""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+def seriesPath(path):
+    root, ext = os.path.splitext(path)
+    return root + "_series" + (ext or ".csv")
+
+
+def runSweep(spec, out, workers=None, timeout=None):
+    """Run every point of a sweep spec that isn't already in the out table"""
+    runs = expandSpec(spec)
+    done = finishedRuns(out)
+    jobs = [(runID(p), p, timeout) for p in runs]
+    jobs = [j for j in jobs if j[0] not in done]
+    print("{0} runs in sweep, {1} already done, {2} to go".format(len(runs), len(runs) - len(jobs), len(jobs)))
+    if not jobs:
+        return
+
+    workers = workers or availableCPUs()
+    workers = min(workers, len(jobs))
+
+    columns = ["runID"] + list(DEFAULTS) + METRICS
+    newTable = not os.path.exists(out)
+    newSeries = not os.path.exists(seriesPath(out))
+    with open(out, "a", newline="") as f, open(seriesPath(out), "a", newline="") as fs:
+        table = csv.DictWriter(f, columns)
+        seriesTable = csv.writer(fs)
+        if newTable:
+            table.writeheader()
+        if newSeries:
+            seriesTable.writerow(["runID", "time", "bonds"])
+
+        for n, (rid, params, metrics, series) in enumerate(runJobs(jobs, workers, timeout), 1):
+            row = {"runID": rid}
+            row.update({k: json.dumps(v) if isinstance(v, list) else v for k, v in params.items()})
+            row.update(metrics)
+            table.writerow(row)
+            seriesTable.writerows((rid, t, b) for t, b in series)
+            f.flush()
+            fs.flush()
+            print("[{0}/{1}] {2} {3} ({4:.1f}s)".format(n, len(jobs), rid, metrics["status"], metrics["wallTime"]))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run a parameter sweep of headless simulations")
+    parser.add_argument("spec", help="JSON sweep description")
+    parser.add_argument("--out", default="sweep.csv", help="results table, also used to resume")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--timeout", type=float, default=None, help="wall-clock limit per run (s)")
+    args = parser.parse_args()
+
+    with open(args.spec) as f:
+        spec = json.load(f)
+    runSweep(spec, args.out, args.workers, args.timeout)
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+"""
+Trajectory output for long runs.
+
+A trajectory is a directory of flat binary files that can be memory-mapped
+for analysis without reading them into memory:
+
+    header.json     particle count, time step, groups and recorded fields
+    frames.idx      one INDEX_DTYPE record per frame
+    positions.f32   float32 positions, one (N, 2) block per frame
+    velocities.f32  float32 velocities, same layout (optional)
+    bonds.i32       int32 particle index pairs of the bonds of all frames
+                    one after another (optional)
+
+The index holds the step of each frame, the byte offset of its block in the
+position file and the slice of the bond file that belongs to it. It is
+written after the data of a chunk, so a reader never sees a frame whose
+data isn't on disk yet, even while the run is still going or after a crash.
+
+Frames are collected in memory and written in chunks by a background
+thread, so the stepping loop only pays for copying the positions out of
+Box2D.
+
+"""
+
+import json, os, queue, threading
+
+import numpy as np
+
+from simulation import TIME_STEP
+
+TRAJECTORY_VERSION = 1
+
+INDEX_DTYPE = np.dtype([
+    ("step", "<i8"),
+    ("offset", "<i8"), # byte offset of the frame in positions.f32 and velocities.f32
+    ("bondOffset", "<i8"), # first bond of the frame in bonds.i32
+    ("bondCount", "<i8"),
+    ])
+
+
+class TrajectoryWriter():
+    def __init__(self, path, every=60, velocities=False, bonds=False, chunk=32):
+        """Record every th step of a simulation to the directory path
+
+        Attach the writer with sim.recorders.append(writer) and call close()
+        when the run is over. An existing trajectory at path is replaced.
+        """
+        self.path = path
+        self.every = every
+        self.velocities = velocities
+        self.bonds = bonds
+        self.chunk = chunk
+
+        self.particles = None
+        self.frames = 0
+        self.bondTotal = 0
+        self.pending = [] # frames not yet handed to the writer thread
+        self.error = None
+
+        os.makedirs(path, exist_ok=True)
+        for name in ("header.json", "frames.idx", "positions.f32", "velocities.f32", "bonds.i32"):
+            if os.path.exists(os.path.join(path, name)):
+                os.remove(os.path.join(path, name))
+
+        # a short queue keeps memory bounded if the disk can't keep up
+        self.queue = queue.Queue(maxsize=4)
+        self.thread = threading.Thread(target=self.writeLoop, daemon=True)
+        self.thread.start()
+
+    def observe(self, sim):
+        """Called by the simulation after every step"""
+        if sim.steps % self.every == 0:
+            self.record(sim)
+
+    def record(self, sim):
+        """Add the current state of sim as a frame"""
+        n = len(sim.bodies)
+        if self.particles is None:
+            self.particles = n
+            self.writeHeader(sim)
+        elif n != self.particles:
+            raise ValueError("Trajectory has {0} particles, the simulation has {1}".format(self.particles, n))
+
+        pos = sim.positions().astype(np.float32)
+        vel = sim.velocities().astype(np.float32) if self.velocities else None
+        pairs = None
+        if self.bonds:
+            ids = sim.bonds.ids(~sim.bonds.broken)
+            pairs = np.column_stack((sim.bonds.pA[ids], sim.bonds.pB[ids])).astype(np.int32)
+        self.pending.append((sim.steps, pos, vel, pairs))
+
+        if len(self.pending) >= self.chunk:
+            self.flush()
+
+    def writeHeader(self, sim):
+        header = {
+            "version": TRAJECTORY_VERSION,
+            "particles": self.particles,
+            "timeStep": TIME_STEP,
+            "every": self.every,
+            "velocities": self.velocities,
+            "bonds": self.bonds,
+            "groupIndex": list(sim.groupIndex),
+            "radii": sim.radii.tolist(),
+        }
+        with open(os.path.join(self.path, "header.json"), "w") as f:
+            json.dump(header, f)
+
+    def flush(self):
+        """Hand the collected frames to the writer thread"""
+        if self.error is not None:
+            raise self.error
+        if self.pending:
+            self.queue.put(self.pending)
+            self.pending = []
+
+    def close(self):
+        """Write the remaining frames and wait for the writer thread"""
+        self.flush()
+        self.queue.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def writeLoop(self):
+        try:
+            files = {}
+            while True:
+                frames = self.queue.get()
+                if frames is None:
+                    break
+                self.writeChunk(frames, files)
+        except Exception as e:
+            self.error = e
+            # keep taking chunks so the stepping loop never blocks on a full queue
+            while self.queue.get() is not None:
+                pass
+        finally:
+            for f in files.values():
+                f.close()
+
+    def writeChunk(self, frames, files):
+        def out(name):
+            if name not in files:
+                files[name] = open(os.path.join(self.path, name), "ab")
+            return files[name]
+
+        frameBytes = self.particles*2*4
+        index = np.zeros(len(frames), dtype=INDEX_DTYPE)
+        out("positions.f32").write(np.concatenate([pos for _, pos, _, _ in frames]).tobytes())
+        if self.velocities:
+            out("velocities.f32").write(np.concatenate([vel for _, _, vel, _ in frames]).tobytes())
+        if self.bonds:
+            out("bonds.i32").write(np.concatenate([pairs for _, _, _, pairs in frames]).tobytes())
+
+        for k, (step, _, _, pairs) in enumerate(frames):
+            count = len(pairs) if pairs is not None else 0
+            index[k] = (step, (self.frames + k)*frameBytes, self.bondTotal, count)
+            self.bondTotal += count
+        self.frames += len(frames)
+
+        # the data goes to disk before the index entries that point at it
+        for name, f in files.items():
+            if name != "frames.idx":
+                f.flush()
+        out("frames.idx").write(index.tobytes())
+        files["frames.idx"].flush()
+
+
+class Trajectory():
+    """Memory-mapped view of a trajectory written by TrajectoryWriter"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "header.json")) as f:
+            self.header = json.load(f)
+        if self.header["version"] != TRAJECTORY_VERSION:
+            raise ValueError("Unsupported trajectory version: {}".format(self.header["version"]))
+
+        n = self.header["particles"]
+        self.index = np.fromfile(os.path.join(path, "frames.idx"), dtype=INDEX_DTYPE)
+        self.steps = self.index["step"]
+        self.times = self.steps*self.header["timeStep"]
+        self.groupIndex = np.array(self.header["groupIndex"])
+        self.radii = np.array(self.header["radii"])
+
+        self.positions = self.mapFrames("positions.f32", n)
+        self.velocities = self.mapFrames("velocities.f32", n) if self.header["velocities"] else None
+        self.bondPairs = None
+        if self.header["bonds"]:
+            total = int(self.index["bondOffset"][-1] + self.index["bondCount"][-1]) if len(self) else 0
+            self.bondPairs = self.map("bonds.i32", np.int32, (total, 2))
+
+    def __len__(self):
+        return len(self.index)
+
+    def map(self, name, dtype, shape):
+        if shape[0] == 0:
+            return np.zeros(shape, dtype=dtype)
+        return np.memmap(os.path.join(self.path, name), dtype=dtype, mode="r", shape=shape)
+
+    def mapFrames(self, name, n):
+        """(frames, N, 2) array backed by the file"""
+        return self.map(name, np.float32, (len(self), n, 2))
+
+    def bonds(self, frame):
+        """(M, 2) particle index pairs of the bonds in a frame"""
+        if self.bondPairs is None:
+            raise ValueError("This trajectory has no bonds")
+        start = self.index["bondOffset"][frame]
+        return self.bondPairs[start:start + self.index["bondCount"][frame]]